@@ -0,0 +1,156 @@
+# Benchmark de los generadores de PDF (pre-orden ventas/costos y anticipo).
+#
+# Corre offline contra las plantillas y fuentes de resources/. Uso, desde
+# la raíz del repo:
+#
+#     python -m benchmarks.bench_pdf                    # compara con baseline.json
+#     python -m benchmarks.bench_pdf --update-baseline  # guarda los resultados actuales
+#     python -m benchmarks.bench_pdf --filter costos --repeat 10
+#     python -m benchmarks.bench_pdf --filter _merge     # sólo el camino PyPDF2 merge_page
+#
+# Para cada caso reporta el tiempo de pared (mediana de --repeat
+# ejecuciones, tras un calentamiento), el pico de memoria (tracemalloc) y
+# el tamaño del PDF. Sale con código 1 si el tiempo mínimo de algún caso
+# supera al del baseline por encima de --threshold.
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+SURCHARGE_COUNTS = [1, 10, 11, 50, 500]
+CONTAINER_COUNTS = [1, 5, 10, 25, 50]
+
+# Cada caso corre en el modo por defecto (xobject) y, con sufijo _merge,
+# por el camino anterior de overlay + PyPDF2 merge_page.
+MODES = {"": "xobject", "_merge": "merge"}
+
+
+def _setup():
+    # Las rutas de plantillas/fuentes son relativas a la raíz del repo
+    os.chdir(ROOT)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    # Streamlit avisa que no hay runtime al importar utils.helpers
+    import streamlit.logger
+    streamlit.logger.set_log_level(logging.ERROR)
+
+    # Caché de PDFs en disco en un directorio limpio: los renders sintéticos
+    # no quedan en resources/cache ni calientan la caché de producción
+    from services.pdf_generator import render_cache
+    render_cache._disk.directory = tempfile.mkdtemp()
+
+
+def build_cases():
+    from benchmarks import payloads
+    from services.pdf_generator.generate_anticipo import generate_pdf
+    from services.pdf_generator import render_pool
+    from services.pdf_generator.generate_preorden import generate_archives
+
+    cases = {}
+    for n in SURCHARGE_COUNTS:
+        order = payloads.pre_orden(n)
+        for suffix, mode in MODES.items():
+            cases[f"preorden_ventas_{n}{suffix}"] = lambda order=order, mode=mode: generate_archives(order, "ventas", mode, use_cache=False)
+            cases[f"preorden_costos_{n}{suffix}"] = lambda order=order, mode=mode: generate_archives(order, "costos", mode, use_cache=False)
+    # Clic repetido sin cambios: acierto en la caché de memoria
+    order = payloads.pre_orden(50)
+    cases["preorden_ventas_50_cache_hit"] = lambda: generate_archives(order, "ventas")
+    # Ventas + costos como en "Generar PDFs": en serie y en el pool de procesos
+    cases["preorden_pair_50_serial"] = lambda: generate_archives(order, "ventas", use_cache=False) + generate_archives(order, "costos", use_cache=False)
+    cases["preorden_pair_50_pool"] = lambda: b"".join(render_pool.render_preorden(order, use_cache=False).values())
+    for n in CONTAINER_COUNTS:
+        request = payloads.anticipo(n)
+        for suffix, mode in MODES.items():
+            cases[f"anticipo_{n}{suffix}"] = lambda request=request, mode=mode: generate_pdf(request, mode=mode, use_cache=False)
+    return cases
+
+
+def measure(fn, repeat: int) -> dict:
+    output = fn()                       # calentamiento (plantillas, fuentes)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "wall_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+        "size_bytes": len(output),
+    }
+
+
+def load_baseline() -> dict:
+    if BASELINE_PATH.exists():
+        return json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+    return {}
+
+
+def compare(name: str, result: dict, baseline: dict, threshold: float) -> str:
+    base = baseline.get(name)
+    if not base:
+        return "new"
+    # El mínimo es mucho menos ruidoso que la mediana para comparar corridas
+    ratio = result["min_ms"] / base["min_ms"] if base["min_ms"] else 1.0
+    flag = "REGRESSION" if ratio > threshold else ("faster" if ratio < 1 / threshold else "ok")
+    return f"{flag} x{ratio:.2f}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de los generadores de PDF")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="sólo casos cuyo nombre contenga este texto")
+    parser.add_argument("--threshold", type=float, default=1.5, help="razón tiempo/baseline que cuenta como regresión")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    _setup()
+    baseline = load_baseline()
+    results = {}
+    regressions = []
+
+    print(f"{'caso':<32}{'wall ms':>10}{'min ms':>10}{'peak KiB':>11}{'bytes':>10}  vs baseline")
+    for name, fn in build_cases().items():
+        if args.filter not in name:
+            continue
+        result = measure(fn, args.repeat)
+        results[name] = result
+        verdict = compare(name, result, baseline, args.threshold)
+        if verdict.startswith("REGRESSION"):
+            regressions.append(name)
+        print(
+            f"{name:<32}{result['wall_ms']:>10.2f}{result['min_ms']:>10.2f}"
+            f"{result['peak_kib']:>11.1f}{result['size_bytes']:>10}  {verdict}"
+        )
+
+    if args.update_baseline:
+        baseline.update(results)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Baseline actualizado: {BASELINE_PATH.relative_to(ROOT)}")
+        return 0
+
+    if regressions:
+        print(f"Regresiones: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# Conteo de llamadas a la API de Sheets por flujo de envío.
+#
+# Instala utils.sheets_backend.InMemoryBackend en lugar de Google Sheets,
+# siembra las hojas con datos de otros casos y ejecuta las mismas
+# funciones de services.sheets_writer que corre la cola de escrituras.
+# Uso, desde la raíz del repo:
+#
+#     python -m benchmarks.bench_sheets
+#     python -m benchmarks.bench_sheets --lines 60 --latency 0.2
+#
+# Cada flujo tiene un presupuesto máximo de llamadas (CALL_BUDGETS); el
+# script sale con código 1 si alguno lo supera.
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SECRETS = """
+[general]
+time_sheet_id = "bench-time-sheet"
+orden_sheet = "bench-orden-sheet"
+data_clientes = "bench-data-clientes"
+
+[google_sheets_credentials]
+type = "service_account"
+"""
+
+# Máximo de llamadas por flujo con los handles ya en caché
+CALL_BUDGETS = {
+    "save_surcharges_orden (caso nuevo)": 4,
+    "save_surcharges_orden (re-guardado)": 6,
+    "load_surcharges_by_case_orden": 0,
+    "save_order_submission (re-envío)": 2,
+    "save_order_submission (orden nueva)": 1,
+    "save_order_submission (sin no_solicitud)": 2,
+    "save_anticipo_submission (en frío)": 3,
+    "save_anticipo_submission": 1,
+    "envío pre-orden completo (en frío)": 12,
+    "append_new_client": 1,
+    "save_new_client_finance": 1,
+    "reinicio con snapshot (sin cambios)": 1,
+}
+
+SURCHARGE_HEADERS = ["no_solicitud", "tipo", "concept", "quantity", "rate", "total", "currency"]
+FINANCE_CLIENT_HEADERS = ["NIT", "CLIENTE", "RAZON_SOCIAL", "CORREO", "CONTACTO", "TELEFONO_CONTACTO", "CORREO_CONTACTO", "DIRECCION"]
+
+
+def _setup():
+    os.chdir(ROOT)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    import streamlit.logger
+    from streamlit import config
+
+    # IDs de hojas ficticios: el backend en memoria los crea al abrirlos
+    secrets_path = Path(tempfile.mkdtemp()) / "secrets.toml"
+    secrets_path.write_text(SECRETS, encoding="utf-8")
+    config.set_option("secrets.files", [str(secrets_path)])
+    # Streamlit avisa que no hay runtime al importar utils.helpers
+    streamlit.logger.set_log_level(logging.ERROR)
+
+
+def _seed(backend, existing_cases: int, lines_per_case: int):
+    import streamlit as st
+    from benchmarks import payloads
+
+    orden = backend.create_spreadsheet(st.secrets["general"]["orden_sheet"])
+    for sheet_name, tipo in (("ventas", "venta"), ("costos", "costo")):
+        ws = orden.create_worksheet(sheet_name)
+        ws._rows.append(SURCHARGE_HEADERS)
+        for case in range(existing_cases):
+            for s in payloads.surcharges(lines_per_case):
+                ws._rows.append([f"M-{case:05d}", tipo, s["concept"], str(s["quantity"]), str(s["rate"]), str(s["total"]), s["currency"]])
+    ordenes = orden.create_worksheet("ORDEN")
+    ordenes._rows.append(["Comercial", "Fecha", "No Solicitud"])
+    ordenes._rows.extend(["Comercial", "2025-01-01", f"M-{case:05d}"] for case in range(existing_cases))
+
+    time_sheet = backend.create_spreadsheet(st.secrets["general"]["time_sheet_id"])
+    time_sheet.create_worksheet("SOLICITUD DE ANTICIPO")
+    clientes = time_sheet.create_worksheet("clientes")
+    clientes._rows.append(["CLIENTE"])
+    clientes._rows.extend([f"CLIENTE {i:05d}"] for i in range(existing_cases))
+
+    finance = backend.create_spreadsheet(st.secrets["general"]["data_clientes"]).create_worksheet("clientes")
+    finance._rows.append(FINANCE_CLIENT_HEADERS)
+    for i in range(existing_cases):
+        finance._rows.append([str(900000000 + i), f"CLIENTE {i:05d}", f"CLIENTE {i:05d} S.A.S", "a@b.co", "Contacto", "3000000", "a@b.co", "Calle 1"])
+
+
+def _measure(backend, name, fn):
+    backend.reset_calls()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    calls = dict(backend.calls)
+    return name, backend.total_calls, elapsed, calls
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Llamadas a la API de Sheets por flujo")
+    parser.add_argument("--lines", type=int, default=30, help="líneas de venta y de costo de la orden")
+    parser.add_argument("--existing-cases", type=int, default=2000, help="casos ya guardados en ventas/costos")
+    parser.add_argument("--latency", type=float, default=0.05, help="latencia simulada por llamada (s)")
+    args = parser.parse_args(argv)
+
+    _setup()
+
+    from benchmarks import payloads
+    from services import sheets_writer
+    from utils import catalog_snapshot
+    from utils.helpers import clients_finance_snapshot, evict_handle, load_client_catalog_finance, use_sheets_backend
+    from utils.sheets_backend import InMemoryBackend
+
+    # Snapshots de listas de clientes en un directorio limpio
+    catalog_snapshot.SNAPSHOT_DIR = tempfile.mkdtemp()
+    backend = InMemoryBackend(latency=args.latency)
+    _seed(backend, args.existing_cases, 5)
+    use_sheets_backend(backend)
+    sheets_writer.get_surcharge_index.clear()
+    sheets_writer.get_order_index.clear()
+
+    order = payloads.pre_orden(args.lines)
+    case = order["no_solicitud"]
+
+    def full_submit():
+        sheets_writer.save_order_submission(order)
+        sheets_writer.save_surcharges_orden(case, order["sales_surcharges"], order["cost_surcharges"])
+
+    def new_finance_client(n):
+        sheets_writer.save_new_client_finance([f"80000000{n}", f"NUEVO {n}", f"NUEVO {n}", "x@y.co", "C", "1", "x@y.co", "Calle 2"])
+        # La fila nueva tiene que quedar en el catálogo sin recargar la hoja
+        assert f"NUEVO {n}" in load_client_catalog_finance()
+
+    def restart():
+        # Se sirve del snapshot en disco al instante; la revalidación corre
+        # en un hilo y sólo descarga la hoja si cambió su modifiedTime
+        # Reinicio real: tampoco quedan handles en caché
+        clients_finance_snapshot.reset()
+        evict_handle("bench-data-clientes")
+        assert "NUEVO 2" in load_client_catalog_finance()
+        clients_finance_snapshot.wait()
+
+    results = [
+        _measure(backend, "envío pre-orden completo (en frío)", full_submit),
+        _measure(backend, "load_surcharges_by_case_orden", lambda: sheets_writer.load_surcharges_by_case_orden(case)),
+        _measure(backend, "save_surcharges_orden (re-guardado)",
+                 lambda: sheets_writer.save_surcharges_orden(case, order["sales_surcharges"], order["cost_surcharges"])),
+        _measure(backend, "save_surcharges_orden (caso nuevo)",
+                 lambda: sheets_writer.save_surcharges_orden("M-NUEVO", order["sales_surcharges"], order["cost_surcharges"])),
+        _measure(backend, "save_order_submission (re-envío)", lambda: sheets_writer.save_order_submission(order)),
+        _measure(backend, "save_order_submission (orden nueva)",
+                 lambda: sheets_writer.save_order_submission({**order, "no_solicitud": "M-NUEVO"})),
+        _measure(backend, "save_order_submission (sin no_solicitud)", lambda: [
+            sheets_writer.save_order_submission({**order, "no_solicitud": "", "client": client})
+            for client in ("CLIENTE SIN CASO 1", "CLIENTE SIN CASO 2")
+        ]),
+        _measure(backend, "save_anticipo_submission (en frío)",
+                 lambda: sheets_writer.save_anticipo_submission(payloads.anticipo(5))),
+        _measure(backend, "save_anticipo_submission",
+                 lambda: sheets_writer.save_anticipo_submission(payloads.anticipo(5))),
+        _measure(backend, "append_new_client (en frío)", lambda: sheets_writer.append_new_client("CLIENTE NUEVO 1")),
+        _measure(backend, "append_new_client", lambda: sheets_writer.append_new_client("CLIENTE NUEVO 2")),
+        _measure(backend, "save_new_client_finance (en frío)", lambda: new_finance_client(1)),
+        _measure(backend, "save_new_client_finance", lambda: new_finance_client(2)),
+        _measure(backend, "reinicio con snapshot (hoja modificada)", restart),
+        _measure(backend, "reinicio con snapshot (sin cambios)", restart),
+    ]
+
+    # Una fila por orden en ORDEN, sin importar cuántas veces se envió
+    orden_keys = backend.open_by_key("bench-orden-sheet").worksheet("ORDEN").col_values(3)
+    assert orden_keys.count(case) == 1 and orden_keys.count("M-NUEVO") == 1, orden_keys
+    # Tras re-guardar, el índice en memoria devuelve lo mismo que uno
+    # reconstruido desde la hoja (mismos textos: 1.0 -> "1", no "1.0")
+    served = {name: repr(sheets_writer.get_surcharge_index(name).records(case)) for name in ("ventas", "costos")}
+    sheets_writer.get_surcharge_index.clear()
+    for name, records in served.items():
+        assert records == repr(sheets_writer.get_surcharge_index(name).records(case)), name
+
+    # Recargos sin caso: se rechazan sin borrar nada
+    ventas_ws = backend.open_by_key("bench-orden-sheet").worksheet("ventas")
+    before = len(ventas_ws.get_all_values())
+    try:
+        sheets_writer.save_surcharges_orden("  ", order["sales_surcharges"], order["cost_surcharges"])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("save_surcharges_orden aceptó un no_solicitud vacío")
+    assert len(ventas_ws.get_all_values()) == before
+
+    # Órdenes sin número: cada envío es su propia fila, ninguna pisa a otra
+    orden_clients = backend.open_by_key("bench-orden-sheet").worksheet("ORDEN").col_values(4)
+    assert all(any(f"CLIENTE SIN CASO {n}" in c for c in orden_clients) for n in (1, 2)), orden_clients
+
+    over_budget = []
+    print(f"{args.lines} líneas por hoja, {args.existing_cases} casos previos, latencia {args.latency * 1000:.0f} ms/llamada\n")
+    print(f"{'flujo':<40}{'llamadas':>9}{'máx':>6}{'tiempo s':>10}  detalle")
+    for name, total, elapsed, calls in results:
+        budget = CALL_BUDGETS.get(name)
+        flag = ""
+        if budget is not None and total > budget:
+            over_budget.append(name)
+            flag = "  <-- excede presupuesto"
+        detail = ", ".join(f"{k}={v}" for k, v in sorted(calls.items()))
+        print(f"{name:<40}{total:>9}{budget if budget is not None else '-':>6}{elapsed:>10.2f}  {detail}{flag}")
+
+    if over_budget:
+        print(f"\nFlujos sobre presupuesto: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# Payloads representativos para los benchmarks. Imitan lo que arman
+# forms/pre_orden_form.forms (order_info) y forms/anticipo_form.forms
+# (request_data), con nombres y textos de largo realista.
+
+CURRENCIES = ["USD", "COP", "USD", "MXN"]
+
+CONTAINER_TYPES = [
+    "20' Dry Standard", "40' Dry Standard", "40' Dry High Cube", "Reefer 20'",
+    "Reefer 40'", "Open Top 20'", "Open Top 40'", "Flat Rack 20'", "Flat Rack 40'", "LCL",
+]
+
+
+def surcharges(n: int, prefix: str = "Recargo") -> list[dict]:
+    lines = []
+    for i in range(n):
+        quantity = float(1 + i % 4)
+        rate = round(35.5 + (i * 17.25) % 900, 2)
+        lines.append({
+            "concept": f"{prefix} {i + 1} - Manejo portuario",
+            "quantity": quantity,
+            "rate": rate,
+            "total": round(quantity * rate, 2),
+            "currency": CURRENCIES[i % len(CURRENCIES)],
+        })
+    return lines
+
+
+def pre_orden(n_surcharges: int) -> dict:
+    return {
+        "commercial": "Pedro Luis Bruges",
+        "no_solicitud": "M-2025-00123",
+        "client": "Importadora del Caribe S.A.S.",
+        "customer_phone": "+57 300 555 0101",
+        "customer_address": "Carrera 57 # 99A-65 Oficina 1003 Edificio Torres del Atlántico\nBarranquilla",
+        "customer_account": "Colombia",
+        "customer_nit": "900.626.680-0",
+        "customer_contact": "María Pérez",
+        "customer_email": "compras@importadoracaribe.com",
+        "bl_awb": "MEDU1234567",
+        "shipper": "Shanghai Export Trading Co. Ltd",
+        "consignee": "Importadora del Caribe S.A.S.",
+        "pol_aol": "Shanghai, China",
+        "pod_aod": "Cartagena, Colombia",
+        "reference": "PO 4500012345 / Maquinaria industrial y repuestos",
+        "cargo_type": "Contenedor",
+        "container_details": {
+            "40' Dry High Cube": {"qty": 3, "names": ["MSCU1234567", "MSCU7654321", "MSCU1112223"]},
+            "20' Dry Standard": {"qty": 1, "names": ["TGHU9988776"]},
+        },
+        "unidad_medida": None,
+        "cantidad_suelta": None,
+        "insurance_required": False,
+        "valor_carga": None,
+        "porcentaje_seguro": None,
+        "sales_surcharges": surcharges(n_surcharges, "Venta"),
+        "cost_surcharges": surcharges(n_surcharges, "Costo"),
+        "final_comments": "Tarifas sujetas a disponibilidad de espacio y equipo. " * 3,
+    }
+
+
+def anticipo(n_containers: int, per_container: int = 3) -> dict:
+    additional = {}
+    for i in range(n_containers):
+        name = f"{CONTAINER_TYPES[i % len(CONTAINER_TYPES)]} #{i + 1}"
+        additional[name] = [
+            {"concept": f"Recargo {j + 1}", "currency": "USD" if j % 2 == 0 else "COP", "cost": 120.0 + 15 * j}
+            for j in range(per_container)
+        ]
+    return {
+        "no_solicitud": "M-2025-00456",
+        "commercial": "Andrés Consuegra",
+        "client": "Importadora del Caribe S.A.S.",
+        "customer_name": "María Pérez",
+        "customer_phone": "+57 300 555 0101",
+        "customer_email": "compras@importadoracaribe.com",
+        "container_type": list(additional),
+        "transport_type": ["Flete Internacional", "Transporte Terrestre"],
+        "operation_type": "Importación",
+        "reference": "PO 4500012345",
+        "additional_surcharges": additional,
+        "trm": 4100.0,
+        "total_cop_trm": "$1.234.567,00 COP",
+    }
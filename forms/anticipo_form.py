@@ -1,11 +1,67 @@
 import streamlit as st
-import math
 import pytz
 from utils.helpers import *
+from services.surcharge_ledger import SurchargeLedger, format_es
+from services.surcharges import ANTICIPO_FIELDS, SurchargeTable
 
 colombia_timezone = pytz.timezone('America/Bogota')
 
-def forms(clients_list):
+NEW_SURCHARGE = {"concept": "", "currency": "", "cost": 0.0}
+
+
+@st.fragment
+def surcharge_editor(container_type):
+    # Recargos por contenedor, TRM y total: al editar se redibuja sólo
+    # esta sección. En un rerun completo devuelve (trm, total con formato).
+    with st.expander("**Surcharges**", expanded=True):
+        tables = {cont: st.session_state["additional_surcharges"][cont] for cont in container_type}
+
+        currencies = {s["currency"] for surcharges in tables.values() for s in surcharges if s["currency"]}
+
+        need_trm = "USD" in currencies and "COP" in currencies
+
+        if need_trm:
+            trm = st.number_input("Enter TRM (USD to COP)*", min_value=0.0, step=0.01, key="trm")
+        else:
+            trm = None
+
+        for cont, surcharges in tables.items():
+            st.write(f"**{cont}**")
+
+            # Claves con el id estable de la fila (ver SurchargeTable)
+            for surcharge in surcharges:
+                row = surcharge.id
+                col1, col2, col3, col4 = st.columns([2.5, 1, 0.5, 0.5])
+
+                with col1:
+                    surcharge["concept"] = st.text_input(f"Concept*", surcharge["concept"], key=f'{cont}_concept_{row}')
+
+                with col2:
+                    surcharge["currency"] = st.selectbox(f"Currency*", ['USD', 'COP'], index=0 if surcharge["currency"] == "USD" else 1, key=f'{cont}_currency_{row}')
+
+                with col3:
+                    surcharge["cost"] = st.number_input(f"Cost*", min_value=0.0, step=0.01, value=surcharge["cost"], key=f'{cont}_cost_{row}')
+
+                with col4:
+                    st.write(" ")
+                    st.write(" ")
+                    st.button("❌", key=f'remove_{cont}_{row}', on_click=surcharges.remove, args=(row,))
+
+            st.button(f"➕ Add Surcharges", key=f"add_{cont}", on_click=surcharges.append, args=(NEW_SURCHARGE,))
+
+        total, currency_total = SurchargeLedger.for_anticipo(tables).converted_total(trm if need_trm else None)
+        formatted_total = f"{format_es(total)} {currency_total}"
+        st.markdown(f"### **Total: {formatted_total}**")
+
+    return trm, formatted_total
+
+
+def forms(clients):
+    # Cambios al selectbox "client" pedidos en el rerun anterior: sólo se
+    # pueden aplicar antes de crear el widget
+    if "client_new" in st.session_state:
+        st.session_state["client"] = st.session_state.pop("client_new")
+
     col1, col2 = st.columns(2)
 
     commercial_op = [" ","Pedro Luis Bruges", "Andrés Consuegra", "Ivan Zuluaga", "Sharon Zuñiga",
@@ -18,7 +74,14 @@ def forms(clients_list):
         no_solicitud = st.text_input("Operation Number (M)*", key="no_solicitud")
 
     with st.expander("**Client Information**",expanded=True):
-        client = st.selectbox("Select your Client*", [" "] + ["+ Add New"] + clients_list, key="client")
+        # Clientes agregados en esta sesión que aún no están en la lista
+        # compartida (sin enviar, o con la escritura todavía en la cola)
+        pending = st.session_state.setdefault("new_clients", [])
+        pending[:] = [name for name in pending if name not in clients]
+        options = clients.options(" ", "+ Add New")
+        if pending:
+            options = options + pending
+        client = st.selectbox("Select your Client*", options, key="client")
 
         new_client_saved = st.session_state.get("new_client_saved", False)
 
@@ -28,9 +91,9 @@ def forms(clients_list):
 
             if st.button("Save Client"):
                 if new_client_name:
-                    if new_client_name not in st.session_state["clients_list"]:
-                        st.session_state["clients_list"].append(new_client_name)
-                        st.session_state["client"] = new_client_name
+                    if new_client_name not in clients and new_client_name not in pending:
+                        pending.append(new_client_name)
+                        st.session_state["client_new"] = new_client_name
                         st.session_state["new_client_saved"] = True
                         st.success(f"✅ Client '{new_client_name}' saved!")
                         st.rerun()
@@ -70,68 +133,15 @@ def forms(clients_list):
         with col6:
             reference = st.text_input("Customer Reference", key="reference")
 
-    with st.expander("**Surcharges**", expanded=True):
-
-        if "additional_surcharges" not in st.session_state or not isinstance(st.session_state["additional_surcharges"], dict):
-            st.session_state["additional_surcharges"] = {}
-
-        def remove_surcharge(container, index):
-            del st.session_state["additional_surcharges"][container][index]
-
-        def add_surcharge(container):
-            st.session_state["additional_surcharges"][container].append({"concept": "", "currency": "", "cost": 0.0})
-
-        all_surcharges = []
-        for cont in container_type:
-            if cont not in st.session_state["additional_surcharges"]:
-                st.session_state["additional_surcharges"][cont] = []
-
-            all_surcharges.extend(st.session_state["additional_surcharges"][cont])
-
-        currencies = {s["currency"] for s in all_surcharges if s["currency"]}
-
-        need_trm = "USD" in currencies and "COP" in currencies
-
-        if need_trm:
-            trm = st.number_input("Enter TRM (USD to COP)*", min_value=0.0, step=0.01, key="trm")
-        else:
-            trm = None
-
-        total = 0
-        currency_total = "COP" if currencies == {"COP"} else "USD" if currencies == {"USD"} else "COP"
-
-        for cont in container_type:
-            st.write(f"**{cont}**")
-
-            for i, surcharge in enumerate(st.session_state["additional_surcharges"][cont]):
-                col1, col2, col3, col4 = st.columns([2.5, 1, 0.5, 0.5])
-
-                with col1:
-                    surcharge["concept"] = st.text_input(f"Concept*", surcharge["concept"], key=f'{cont}_concept_{i}')
-
-                with col2:
-                    surcharge["currency"] = st.selectbox(f"Currency*", ['USD', 'COP'], index=0 if surcharge["currency"] == "USD" else 1, key=f'{cont}_currency_{i}')
-
-                with col3:
-                    surcharge["cost"] = st.number_input(f"Cost*", min_value=0.0, step=0.01, value=surcharge["cost"], key=f'{cont}_cost_{i}')
-
-                with col4:
-                    st.write(" ")
-                    st.write(" ")
-                    st.button("❌", key=f'remove_{cont}_{i}', on_click=remove_surcharge, args=(cont, i))
-
-                if surcharge["currency"] == "USD":
-                    total += surcharge["cost"] * (trm if need_trm else 1)
-                else:
-                    total += surcharge["cost"]
+    if "additional_surcharges" not in st.session_state or not isinstance(st.session_state["additional_surcharges"], dict):
+        st.session_state["additional_surcharges"] = {}
 
-            st.button(f"➕ Add Surcharges", key=f"add_{cont}", on_click=add_surcharge, args=(cont,))
+    for cont in container_type:
+        surcharges = st.session_state["additional_surcharges"].get(cont)
+        if not isinstance(surcharges, SurchargeTable):
+            st.session_state["additional_surcharges"][cont] = SurchargeTable.coerce(surcharges, ANTICIPO_FIELDS)
 
-        total_rounded = math.ceil(total * 100) / 100
-        symbol = "$" if currency_total == "USD" else "$"
-        suffix = "USD" if currency_total == "USD" else "COP"
-        formatted_total = f"{symbol}{total_rounded:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") + f" {suffix}"
-        st.markdown(f"### **Total: {formatted_total}**")
+    trm, formatted_total = surcharge_editor(container_type)
 
     request_data = {
         "no_solicitud": no_solicitud,
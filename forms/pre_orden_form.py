@@ -1,15 +1,87 @@
 import streamlit as st
-import pandas as pd
 from services.sheets_writer import save_new_client_finance, load_surcharges_by_case_orden
+from services.surcharge_ledger import SurchargeLedger, serialize_totals
+from services.surcharges import SurchargeTable
 
-def forms(df_clients):
+CURRENCIES = ['USD', 'COP', 'MXN']
+NEW_SURCHARGE = {"concept": "", "quantity": 0.0, "rate": 0.0, "total": 0.0, "currency": "USD"}
+
+
+def surcharge_rows(state_key, prefix):
+    # Filas de ventas o costos. Las claves de los widgets llevan el id
+    # estable de la fila: borrar una no corre las de abajo, así el botón
+    # ❌ es un callback y no hace falta st.rerun().
+    surcharges = st.session_state[state_key]
+
+    for surcharge in surcharges:
+        row = surcharge.id
+        col1, col2, col3, col4, col5, col6 = st.columns([2.5, 0.5, 0.8, 0.8, 0.7, 0.5])
+
+        with col1:
+            surcharge["concept"] = st.text_input(f"Concept*", surcharge["concept"], key=f'{prefix}_concept_{row}')
+
+        with col2:
+            surcharge["quantity"] = st.number_input(f"Quantity*", surcharge["quantity"], key=f'{prefix}_quantity_{row}')
+
+        with col3:
+            surcharge["rate"] = st.number_input(f"Rate*", surcharge["rate"], key=f'{prefix}_rate_{row}')
+
+        with col4:
+            computed_total = surcharge["rate"] * surcharge["quantity"]
+            surcharge["total"] = st.number_input(f"Total*", computed_total, key=f'{prefix}_total_{row}')
+
+        with col5:
+            surcharge["currency"] = st.selectbox(
+                f"Currency*", CURRENCIES,
+                index=CURRENCIES.index(surcharge["currency"]),
+                key=f'{prefix}_currency_{row}'
+            )
+
+        with col6:
+            st.write(" ")
+            st.write(" ")
+            st.button("❌", key=f'remove_{prefix}_{row}', on_click=surcharges.remove, args=(row,))
+
+    st.button("➕ Add Surcharge", key=f"add_{prefix}_surcharge", on_click=surcharges.append, args=(NEW_SURCHARGE,))
+
+
+def surcharge_totals(sales: SurchargeTable, costs: SurchargeTable) -> dict:
+    # El ledger sólo se vuelve a calcular si cambió alguna de las tablas
+    key = (sales.version, costs.version)
+    cached = st.session_state.get("surcharge_totals")
+    if cached is None or cached[0] != key:
+        cached = st.session_state["surcharge_totals"] = (key, SurchargeLedger.for_order(sales, costs).summary())
+    return cached[1]
+
+
+@st.fragment
+def surcharge_editors() -> dict:
+    # Ventas, Costos y el profit se redibujan solos al editar un recargo,
+    # sin volver a correr el resto del formulario (catálogo de clientes,
+    # datos de la carga...). En un rerun completo devuelve los totales.
+    with st.expander("**Ventas**", expanded=True):
+        surcharge_rows("sales_surcharges", "sale")
+        sales_totals_box = st.container()
+
+    with st.expander("**Costos**", expanded=True):
+        surcharge_rows("cost_surcharges", "cost")
+        cost_totals_box = st.container()
+
+    totals = surcharge_totals(st.session_state["sales_surcharges"], st.session_state["cost_surcharges"])
+    for box, name in ((sales_totals_box, "ventas"), (cost_totals_box, "costos")):
+        for currency, amount in totals[name].items():
+            box.markdown(f"**Total {currency}**: {amount:,.2f} {currency}")
+
+    for currency, amount in totals["profit"].items():
+        st.markdown(f"**Profit {currency}**: {amount:,.2f} {currency}")
+
+    return totals
+
+
+def forms(client_catalog):
     if "client_new" in st.session_state:
         st.session_state["client"] = st.session_state.pop("client_new")
 
-    df_clients = df_clients.drop_duplicates(subset="CLIENTE")
-    clients_list = df_clients["CLIENTE"].dropna().unique().tolist()
-    client_lookup = df_clients.set_index("CLIENTE").to_dict(orient="index")
-
     customer_phone   = ""
     customer_address = ""
     customer_account = ""
@@ -47,10 +119,10 @@ def forms(df_clients):
             st.error(f"⚠️ Error al cargar recargos: {e}")
 
     with st.expander("**Información del Cliente**", expanded=True):
-        client = st.selectbox("Selecciona el cliente*", [" "] + ["+ Add New"] + clients_list, key="client")
+        client = st.selectbox("Selecciona el cliente*", client_catalog.options(" ", "+ Add New"), key="client")
 
-        if client in client_lookup:
-            client_info = client_lookup[client]
+        client_info = client_catalog.get(client)
+        if client_info is not None:
 
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -72,6 +144,9 @@ def forms(df_clients):
             st.write("### Agregar Nuevo Cliente")
 
             new_client_name = st.text_input("Nombre del Cliente*", key="new_client_name")
+            similar = client_catalog.search(new_client_name, limit=5) if new_client_name.strip() else []
+            if similar:
+                st.caption(f"Clientes parecidos: {', '.join(map(str, similar))}")
 
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -97,7 +172,7 @@ def forms(df_clients):
 
                 if not campos_ok:
                     st.error("⚠️ Por favor completa todos los campos obligatorios marcados con *.")
-                elif new_client_name in clients_list:
+                elif new_client_name in client_catalog:
                     st.warning("⚠️ Este cliente ya existe.")
                 else:
                     new_row = [
@@ -210,124 +285,15 @@ def forms(df_clients):
                 st.write("**Valor del seguro**")
                 st.write(valor_seguro)
 
-    with st.expander("**Ventas**", expanded=True):
-        if "sales_surcharges" not in st.session_state or not isinstance(st.session_state["sales_surcharges"], list):
-            st.session_state["sales_surcharges"] = []
+    for state_key in ("sales_surcharges", "cost_surcharges"):
+        if not isinstance(st.session_state.get(state_key), SurchargeTable):
+            st.session_state[state_key] = SurchargeTable.coerce(st.session_state.get(state_key))
 
-        def remove_sales_surcharge(index):
-            if 0 <= index < len(st.session_state["sales_surcharges"]):
-                st.session_state["sales_surcharges"].pop(index)
-
-        def add_sales_surcharge():
-            st.session_state["sales_surcharges"].append({"concept": "", "quantity": 0.0, "rate": 0.0 , "total": 0.0, "currency": "USD"})
-
-        for i, surcharge in enumerate(st.session_state["sales_surcharges"]):
-            col1, col2, col3, col4, col5, col6 = st.columns([2.5, 0.5, 0.8, 0.8, 0.7, 0.5])
-
-            with col1:
-                surcharge["concept"] = st.text_input(f"Concept*", surcharge["concept"], key=f'sale_concept_{i}')
-            
-            with col2:
-                surcharge["quantity"] = st.number_input(f"Quantity*", surcharge["quantity"], key=f'sale_quantity_{i}')
-            
-            with col3:
-                surcharge["rate"] = st.number_input(f"Rate*", surcharge["rate"], key=f'sale_rate_{i}')
-            
-            with col4:
-                computed_total = surcharge["rate"] * surcharge["quantity"]
-                surcharge["total"] = st.number_input(f"Total*", computed_total, key=f'sale_total_{i}')
+    totals = surcharge_editors()
 
-            with col5:
-                surcharge["currency"] = st.selectbox(
-                    f"Currency*", ['USD', 'COP', 'MXN'],
-                    index=['USD', 'COP', 'MXN'].index(surcharge["currency"]),
-                    key=f'sale_currency_{i}'
-                )
-
-            with col6:
-                st.write(" ")
-                st.write(" ")
-                if st.button("❌", key=f'remove_sale_{i}'):
-                    remove_sales_surcharge(i)
-                    st.rerun()
-
-        st.button("➕ Add Surcharge", key="add_sale_surcharge", on_click=add_sales_surcharge)
-
-        sales_totals = {}
-        for surcharge in st.session_state["sales_surcharges"]:
-            currency = surcharge["currency"]
-            value = surcharge.get("total", 0.0)
-            sales_totals[currency] = sales_totals.get(currency, 0.0) + value
-
-        for currency, amount in sales_totals.items():
-            st.markdown(f"**Total {currency}**: {amount:,.2f} {currency}")
-
-    with st.expander("**Costos**", expanded=True):
-        if "cost_surcharges" not in st.session_state or not isinstance(st.session_state["cost_surcharges"], list):
-            st.session_state["cost_surcharges"] = []
-
-        def remove_cost_surcharge(index):
-            if 0 <= index < len(st.session_state["cost_surcharges"]):
-                st.session_state["cost_surcharges"].pop(index)
-
-        def add_cost_surcharge():
-            st.session_state["cost_surcharges"].append({"concept": "", "quantity": 0.0, "rate": 0.0 , "total": 0.0, "currency": "USD"})
-
-        for i, surcharge in enumerate(st.session_state["cost_surcharges"]):
-
-            col1, col2, col3, col4, col5, col6 = st.columns([2.5, 0.5, 0.8, 0.8, 0.7, 0.5])
-
-            with col1:
-                surcharge["concept"] = st.text_input(f"Concept*", surcharge["concept"], key=f'cost_concept_{i}')
-
-            with col2:
-                surcharge["quantity"] = st.number_input(f"Quantity*", surcharge["quantity"], key=f'cost_quantity_{i}')
-
-            with col3:
-                surcharge["rate"] = st.number_input(f"Rate*", surcharge["rate"], key=f'cost_rate_{i}')
-
-            with col4:
-                computed_total = surcharge["rate"] * surcharge["quantity"]
-                surcharge["total"] = st.number_input(f"Total*", computed_total, key=f'cost_total_{i}')
-
-            with col5:
-                surcharge["currency"] = st.selectbox(
-                    f"Currency*", ['USD', 'COP', 'MXN'],
-                    index=['USD', 'COP', 'MXN'].index(surcharge["currency"]),
-                    key=f'cost_currency_{i}'
-                )
-
-            with col6:
-                st.write(" ")
-                st.write(" ")
-                if st.button("❌", key=f'remove_cost_{i}'):
-                    remove_cost_surcharge(i)
-                    st.rerun()
-
-        st.button("➕ Add Surcharge", key="add_cost_surcharge", on_click=add_cost_surcharge)
-
-        cost_totals = {}
-        for surcharge in st.session_state["cost_surcharges"]:
-            currency = surcharge["currency"]
-            value = surcharge.get("total", 0.0)
-            cost_totals[currency] = cost_totals.get(currency, 0.0) + value
-
-        for currency, amount in cost_totals.items():
-            st.markdown(f"**Total {currency}**: {amount:,.2f} {currency}")
-    
     with st.expander("**Comentarios**", expanded=True):
         final_comments = st.text_area('Comentarios Finales', key="final_comments")
 
-    profit_totals = {}
-    all_currencies = set(sales_totals) | set(cost_totals)   # une todas las monedas presentes
-    for currency in all_currencies:
-        sales_amount = sales_totals.get(currency, 0.0)
-        cost_amount  = cost_totals.get(currency, 0.0)
-        profit_totals[currency] = sales_amount - cost_amount
-
-    for currency, amount in profit_totals.items():
-        st.markdown(f"**Profit {currency}**: {amount:,.2f} {currency}")
-
     order_info = {
         "commercial": st.session_state.get("commercial", ""),
         "no_solicitud": no_solicitud,
@@ -354,6 +320,7 @@ def forms(df_clients):
         "sales_surcharges": st.session_state.get("sales_surcharges", []),
         "cost_surcharges": st.session_state.get("cost_surcharges", []),
         "final_comments": final_comments,
+        "totals": serialize_totals(totals),
     }
 
     return order_info
\ No newline at end of file
@@ -1,342 +1,163 @@
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 import PyPDF2
-from reportlab.platypus import Table, TableStyle
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.pdfmetrics import stringWidth
 from datetime import datetime
-import os
-from textwrap import wrap
-from collections import defaultdict
-from decimal import Decimal, ROUND_HALF_UP
+from io import BytesIO
+from services.pdf_generator import render_cache
+from services.surcharge_ledger import format_es, order_totals
+from services.pdf_generator.layout import block, layout_path, load_layout
+from services.pdf_generator.resources import FONT_FILES, register_fonts, render_on_template, resolve_mode, template_pages
+from services.pdf_generator.text_layout import format_amount
 
 # ----------------------------------------------------------------------
-# Utilidad para “wrappear” texto
+# Registro de fuentes (una sola vez por proceso, ver resources.py)
 # ----------------------------------------------------------------------
 
-def wrap_text(text, max_chars):
-    lines = []
-    words = text.split()
-    line = ""
-    for word in words:
-        if len(line + " " + word) <= max_chars:
-            line = f"{line} {word}".strip()
-        else:
-            lines.append(line)
-            line = word
-    if line:
-        lines.append(line)
-    return lines
-
-def draw_wrapped_string(c, x, y, text, max_chars, line_height=7):
-    lines = wrap_text(text, max_chars)
-    for i, line in enumerate(lines):
-        c.drawString(x, y - i * line_height, line)
+register_fonts()
+
+# Coordenadas, fuentes y plantillas: resources/layouts/preorden.json
+LAYOUT = "preorden"
 
 # ----------------------------------------------------------------------
-# Registro de fuentes (sobrescribe las advertencias originales)
+# Bloques del layout que dependen de la forma de los datos
 # ----------------------------------------------------------------------
-FONT_REGULAR = "OpenSauce"
-FONT_BOLD    = "OpenSauceBold"
-
-def _register_fonts():
-    font_path = "resources/fonts/OpenSauceSans-Regular.ttf"
-    font_bold = "resources/fonts/OpenSauceSans-Bold.ttf"
-    if os.path.exists(font_path):
-        pdfmetrics.registerFont(TTFont(FONT_REGULAR, font_path))
-    if os.path.exists(font_bold):
-        pdfmetrics.registerFont(TTFont(FONT_BOLD,   font_bold))
 
-_register_fonts()
+@block("cargo_details")
+def draw_cargo_details(c, data, x, y, col_gap, leading, max_rows):
+    # Nombres de contenedor uno debajo de otro, max_rows por columna
+    cargo_type = (data.get("cargo_type") or "").strip().lower()
+    container_details = data.get("container_details") or {}
+
+    if cargo_type == "carga suelta" or not container_details:
+        unidad = str(data.get("unidad_medida", "")).upper()
+        cantidad = data.get("cantidad_suelta", "")
+        c.drawString(x, y, f"{cantidad} {unidad}")
+        return
+
+    row_count = 0
+    col_count = 0
+    for ctype, details in container_details.items():
+        cont_type = ctype.upper()
+        for name in details.get("names", []):
+            c.drawString(x + col_count * col_gap, y - row_count * leading, f"{name.upper()} - {cont_type}")
+
+            row_count += 1
+            if row_count >= max_rows:
+                row_count = 0
+                col_count += 1  # Avanzar a la siguiente columna
+
+
+@block("currency_totals")
+def draw_currency_totals(c, data, x_label, x_value, y, leading):
+    # Totales por moneda ya calculados por SurchargeLedger (costos con +4%)
+    for i, (curr, total) in enumerate(data["currency_totals"].items()):
+        y_pos = y - i * leading
+        c.drawString(x_label, y_pos, f"TOTAL {curr}")
+        c.drawString(x_value, y_pos, format_es(total))
 
 # ----------------------------------------------------------------------
 # Capa de datos (overlay)
 # ----------------------------------------------------------------------
 
-def create_overlay(data: dict, overlay_path: str, surcharge_key: str = "sales_surcharges", page: int = 1, apply_markup: bool = False):
-    c = canvas.Canvas(overlay_path, pagesize=letter)
-
-    surcharges = data.get(surcharge_key, [])
-    is_last_page = False
-
-    if page == 1:
-        current_date = datetime.today().strftime("%d/%m/%Y")
-
-        c.setFont(FONT_REGULAR, 6)
-        c.drawString(442, 590, data.get("no_solicitud", "").upper()) 
-
-        c.setFont(FONT_BOLD, 7)
-        c.drawString(500, 669, current_date)
-
-        c.setFont(FONT_REGULAR, 7)
-        c.drawString(115, 583, data.get("client", "").upper())
-        c.drawString(170, 569, data.get("customer_account", "").upper())
-        c.drawString(95, 555, data.get("customer_nit", "").upper())
-        c.drawString(105, 540, data.get("customer_email", "").upper())
-
-        address_text = data.get("customer_address", "").upper()
-
-        max_chars    = 30   
-        line_height  = 11       
-        x_address    = 125
-        y_address_start = 527
-
-        c.setFont(FONT_REGULAR, 7) 
-
-        lines = []
-        for paragraph in address_text.split("\n"):
-            wrapped_lines = wrap(paragraph, max_chars)
-            lines.extend(wrapped_lines if wrapped_lines else [""])
-
-        for i, line in enumerate(lines):
-            y = y_address_start - i * line_height
-            c.drawString(x_address, y, line)
-
-        # ----------------------- datos transporte / referencia --------------------
-        c.setFont(FONT_REGULAR, 6)
-
-        draw_wrapped_string(c, 282, 590, data.get("bl_awb", "").upper(), max_chars=20)
-        draw_wrapped_string(c, 442, 510, data.get("pod_aod", "").upper(), max_chars=20)
-        draw_wrapped_string(c, 282, 510, data.get("pol_aol", "").upper(), max_chars=20)
-        draw_wrapped_string(c, 282, 550, data.get("shipper", "").upper(), max_chars=20)
-        draw_wrapped_string(c, 442, 550, data.get("consignee", "").upper(), max_chars=20)
-
-        ref_text     = data.get("reference", "").upper() 
-        max_chars    = 20            # ~ ancho de unos 120 pt a font-size 7 (ajústalo)
-        line_height  = 11           # puntos de separación vertical
-        x_ref        = 282
-        y_ref_start  = 470         # coordenada de la 1.ª línea
-
-        c.setFont(FONT_REGULAR, 6)
-
-        lines = []
-        for paragraph in ref_text.split("\n"):
-            wrapped_lines = wrap(paragraph, max_chars)
-            lines.extend(wrapped_lines if wrapped_lines else [""])
-
-        for i, line in enumerate(lines):
-            y = y_ref_start - i * line_height
-            c.drawString(x_ref, y, line)
-
-        # ────────────────── Nombres de contenedor uno debajo de otro ──────────────────
-        c.setFont(FONT_REGULAR, 6)
-
-        # Configuración de columnas
-        x_start     = 75        # Columna izquierda
-        x_gap       = 115       # Distancia horizontal entre columnas
-        y_start     = 455       # Coordenada Y inicial
-        line_height = 11        # Separación vertical
-        max_rows    = 5         # Máximo de filas antes de pasar a la siguiente columna
-
-        cargo_type = (data.get("cargo_type") or "").strip().lower()
-        container_details = data.get("container_details") or {}
-
-        if cargo_type == "carga suelta" or not container_details:
-            unidad = str(data.get("unidad_medida", "")).upper()
-            cantidad = data.get("cantidad_suelta", "")
-            c.drawString(x_start, y_start, f"{cantidad} {unidad}")
-        else:
-            row_count = 0
-            col_count = 0
-            for ctype, details in container_details.items():
-                cont_type = ctype.upper()
-                for name in details.get("names", []):
-                    # Calcular posición en función de la columna
-                    x_pos = x_start + (col_count * x_gap)
-                    y_pos = y_start - (row_count * line_height)
-                    
-                    line_text = f"{name.upper()} - {cont_type}"
-                    c.drawString(x_pos, y_pos, line_text)
-                    
-                    row_count += 1
-                    if row_count >= max_rows:
-                        row_count = 0
-                        col_count += 1  # Avanzar a la siguiente columna
-
-
-        if page == 1:
-            surcharges_to_draw = surcharges[:10]
-        elif page == 2:
-            surcharges_to_draw = surcharges[10:]
-        else:
-            surcharges_to_draw = []
-
-        table_data = []
-
-        for surcharge in surcharges_to_draw:
-            concept   = surcharge.get("concept", "").upper()
-            quantity  = surcharge.get("quantity", 0)
-            rate      = surcharge.get("rate", 0)
-            total     = surcharge.get("total", rate * quantity)
-            currency  = surcharge.get("currency", "")
-
-            table_data.append([
-                concept,               # Concepto
-                str(quantity),         # Cantidad
-                f"${rate:,.2f}",       # Tarifa / Rate
-                f"${total:,.2f}",      # Total
-                currency,              # Moneda
-            ])
-
-        # ──────────────────────────────────────────────────────────────────────────
-        # Sólo procedemos si HAY datos
-        # ──────────────────────────────────────────────────────────────────────────
-        if table_data:
-            col_widths = [180, 150, 20, 130, 50]
-            table = Table(table_data, colWidths=col_widths)
-
-            table.setStyle(TableStyle([
-                ("FONTNAME",  (0, 0), (-1, -1), FONT_REGULAR),
-                ("FONTSIZE",  (0, 0), (-1, -1), 6),
-                ("ALIGN",     (0, 0), (-1, -1), "CENTER"),
-                ("VALIGN",    (0, 0), (-1, -1), "MIDDLE"),
-                ("TOPPADDING",    (0, 0), (-1, -1), 0.3),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 0.3),
-                ("LEFTPADDING",   (0, 0), (-1, -1), 1),
-                ("RIGHTPADDING",  (0, 0), (-1, -1), 1),
-            ]))
-
-            x, y = 10, 358
-            table.wrapOn(c, 0, 0)
-            table.drawOn(c, x, y - table._height)
-
-        # Definir si esta es la última página
-        is_last_page = (len(surcharges) <= 10)
-
-    elif page == 2:
-        # Dibujar solo recargos de la página 2
-        surcharges_to_draw = surcharges[10:]
-        table_data = []
-        for surcharge in surcharges_to_draw:
-            concept   = surcharge.get("concept", "").upper()
-            quantity  = surcharge.get("quantity", 0)
-            rate      = surcharge.get("rate", 0)
-            total     = surcharge.get("total", rate * quantity)
-            currency  = surcharge.get("currency", "")
-            table_data.append([
-                concept, str(quantity), f"${rate:,.2f}", f"${total:,.2f}", currency,
-            ])
-
-        if table_data:
-            col_widths = [180, 150, 20, 130, 50]
-            table = Table(table_data, colWidths=col_widths)
-            table.setStyle(TableStyle([
-                ("FONTNAME",  (0, 0), (-1, -1), FONT_REGULAR),
-                ("FONTSIZE",  (0, 0), (-1, -1), 6),
-                ("ALIGN",     (0, 0), (-1, -1), "CENTER"),
-                ("VALIGN",    (0, 0), (-1, -1), "MIDDLE"),
-                ("TOPPADDING",    (0, 0), (-1, -1), 0.3),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 0.3),
-                ("LEFTPADDING",   (0, 0), (-1, -1), 1),
-                ("RIGHTPADDING",  (0, 0), (-1, -1), 1),
-            ]))
-            x, y = 10, 560
-            table.wrapOn(c, 0, 0)
-            table.drawOn(c, x, y - table._height)
-
-        # Página 2 siempre es la última
-        is_last_page = True
-
-    # ------------------- Totales y comentarios -------------------
-    if is_last_page:
-        totales = defaultdict(Decimal)
-        for s in surcharges:
-            currency = s.get("currency", "").upper()
-            base_total = Decimal(s.get("total", 0))
-            if apply_markup:
-                base_total *= Decimal("1.04")  # Aplica 4% si es costos
-            total = base_total.quantize(Decimal("0.01"), ROUND_HALF_UP)
-            totales[currency] += total
-
-        x_label, x_value, y_start, line_height = 450, 510, 210, 13
-        c.setFont(FONT_BOLD, 8)
-        for i, (curr, total) in enumerate(totales.items()):
-            y_pos = y_start - i * line_height
-            c.drawString(x_label, y_pos, f"TOTAL {curr}")
-            formatted = f"${total:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-            c.drawString(x_value, y_pos, formatted)
-
-        comments = data.get("final_comments", "").upper()
-        x_comments, y_comments, max_chars, comments_height = 60, 120, 110, 11
-        c.setFont(FONT_REGULAR, 6)
-        for i, line in enumerate(wrap(comments, max_chars)):
-            c.drawString(x_comments, y_comments - i * comments_height, line)
+def surcharge_rows(surcharges: list) -> list[tuple]:
+    rows = []
+    for surcharge in surcharges:
+        concept   = surcharge.get("concept", "").upper()
+        quantity  = surcharge.get("quantity", 0)
+        rate      = surcharge.get("rate", 0)
+        total     = surcharge.get("total", rate * quantity)
+        currency  = surcharge.get("currency", "")
+
+        rows.append((
+            concept,               # Concepto
+            str(quantity),         # Cantidad
+            format_amount(rate),   # Tarifa / Rate
+            format_amount(total),  # Total
+            currency,              # Moneda
+        ))
+    return rows
+
+
+def page_drawer(data: dict, variant: str = "ventas"):
+    # Devuelve draw_page(c, page_no), el número de páginas con datos y la
+    # plantilla (ruta, índices de página) que corresponde a ese número.
+    plan = load_layout(LAYOUT)
+    if variant not in plan.variants:
+        raise ValueError(f"Variant desconocida: {variant}")
+
+    cfg = plan.variants[variant]
+    surcharges = data.get(cfg["rows"], [])
+    ctx = {
+        **data,
+        "today": datetime.today().strftime("%d/%m/%Y"),
+        "currency_totals": order_totals(data)[cfg["totals"]],
+    }
+    draw_page, pages = plan.page_drawer(ctx, surcharge_rows(surcharges))
+    return draw_page, pages, plan.template_for(variant, pages)
+
+
+def create_overlay(data: dict, variant: str = "ventas") -> tuple[BytesIO, int, tuple]:
+    # Todas las páginas del overlay en un solo canvas (modo "merge")
+    overlay = BytesIO()
+    c = canvas.Canvas(overlay, pagesize=letter)
+
+    draw_page, pages, template = page_drawer(data, variant)
+    for page_no in range(pages):
+        if page_no:
+            c.showPage()
+        draw_page(c, page_no)
 
     c.save()
+    overlay.seek(0)
+    return overlay, pages, template
 
 # ----------------------------------------------------------------------
 # Combinar plantilla + overlay
 # ----------------------------------------------------------------------
 
-def merge_pdfs(template_path, overlay_path, output_path):
-    template_pdf = PyPDF2.PdfReader(template_path)
-    overlay_pdf = PyPDF2.PdfReader(overlay_path)
+def merge_pdfs(template_path, overlay, page_indexes=None) -> bytes:
     writer = PyPDF2.PdfWriter()
-
-    for idx, template_page in enumerate(template_pdf.pages):
-        if idx < len(overlay_pdf.pages):
-            template_page.merge_page(overlay_pdf.pages[idx])
+    overlay_pages = PyPDF2.PdfReader(overlay).pages
+
+    # Las páginas de la plantilla vienen del registro ya parseadas; la
+    # página i del overlay se estampa sobre la i-ésima de `page_indexes`
+    # (las de continuación se repiten) y el resto pasa tal cual.
+    for idx, template_page in enumerate(template_pages(template_path, page_indexes)):
+        if idx < len(overlay_pages):
+            template_page.merge_page(overlay_pages[idx])
         writer.add_page(template_page)
 
-    with open(output_path, "wb") as f_out:
-        writer.write(f_out)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
 
 # ----------------------------------------------------------------------
 # Función pública que genera el PDF
 # ----------------------------------------------------------------------
 
-def generate_archives(quotation_data: dict, variant: str = "ventas"):
-
-    surcharge_key = "sales_surcharges" if variant == "ventas" else "cost_surcharges"
-    num_surcharges = len(quotation_data.get(surcharge_key, []))
-    template_version = "short" if num_surcharges <= 10 else "long"
-
-    config = {
-        "ventas": {
-            "surcharge_key": "sales_surcharges",
-            "template": {
-                "short": "resources/templates/ORDER1.pdf",
-                "long": "resources/templates/ORDER2.pdf",
-            },
-            "output": "resources/output/pre_orden_ventas.pdf",
-        },
-        "costos": {
-            "surcharge_key": "cost_surcharges",
-            "template": {
-                "short": "resources/templates/PRE_ORDER1.pdf",
-                "long": "resources/templates/PRE_ORDER2.pdf",
-            },
-            "output": "resources/output/pre_orden_costos.pdf",
-        },
-    }
+def _render(quotation_data: dict, variant: str, mode: str) -> bytes:
+    if mode == "merge":
+        overlay, _, (template, page_indexes) = create_overlay(quotation_data, variant)
+        return merge_pdfs(template, overlay, page_indexes)
 
-    if variant not in config:
-        raise ValueError(f"Variant desconocida: {variant}")
+    draw_page, _, (template, page_indexes) = page_drawer(quotation_data, variant)
+    return render_on_template(template, page_indexes, draw_page)
 
-    cfg = config[variant]
-    selected_template = cfg["template"][template_version]
 
-    pages_needed = 1 if template_version == "short" else 2
-    overlay_paths = []
-
-    for page in range(1, pages_needed + 1):
-        overlay_path = f"resources/temp/overlay_{variant}_page{page}.pdf"
-        os.makedirs(os.path.dirname(overlay_path), exist_ok=True)
-        create_overlay(quotation_data, overlay_path, surcharge_key, page, apply_markup=(variant == "costos"))
-        overlay_paths.append(overlay_path)
-
-    # Combina todas las páginas de overlays generadas en un solo PDF
-    combined_overlay_path = f"resources/temp/combined_overlay_{variant}.pdf"
-    overlay_writer = PyPDF2.PdfWriter()
+def cache_key(quotation_data: dict, variant: str = "ventas", mode: str | None = None) -> str:
+    mode = resolve_mode(mode)
+    plan = load_layout(LAYOUT)
+    if variant not in plan.variants:
+        raise ValueError(f"Variant desconocida: {variant}")
 
-    for path in overlay_paths:
-        overlay_pdf = PyPDF2.PdfReader(path)
-        overlay_writer.add_page(overlay_pdf.pages[0])
+    files = [layout_path(LAYOUT), *FONT_FILES.values(), *(t["path"] for t in plan.variants[variant]["templates"])]
+    return render_cache.make_key(LAYOUT, quotation_data, files, variant=variant, mode=mode)
 
-    with open(combined_overlay_path, "wb") as f_out:
-        overlay_writer.write(f_out)
 
-    merge_pdfs(selected_template, combined_overlay_path, cfg["output"])
+def generate_archives(quotation_data: dict, variant: str = "ventas", mode: str | None = None, use_cache: bool = True) -> bytes:
+    mode = resolve_mode(mode)
+    register_fonts()
 
-    return cfg["output"]
\ No newline at end of file
+    if not use_cache:
+        return _render(quotation_data, variant, mode)
+    return render_cache.get_or_render(cache_key(quotation_data, variant, mode), lambda: _render(quotation_data, variant, mode))
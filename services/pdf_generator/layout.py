@@ -0,0 +1,399 @@
+import json
+import os
+import threading
+from string import Formatter
+
+from services.pdf_generator.resources import FONT_BOLD, FONT_REGULAR
+from services.pdf_generator.text_layout import fit_lines, glyph_widths, text_width
+
+# ----------------------------------------------------------------------
+# Layouts declarativos de las plantillas.
+#
+# Cada archivo de LAYOUT_DIR describe, para un grupo de plantillas, qué
+# campo va en qué coordenada, con qué fuente y cómo se parte en líneas,
+# dónde va la tabla y cómo se pagina. load_layout() lo compila una sola
+# vez (mientras no cambie el mtime) a listas de operaciones ya resueltas:
+# fuentes, estilos de tabla y textos con {campos} pre-parseados. Cada
+# render sólo recorre esas listas contra el contexto de la orden.
+# ----------------------------------------------------------------------
+
+LAYOUT_DIR = "resources/layouts"
+
+FONTS = {"regular": FONT_REGULAR, "bold": FONT_BOLD}
+
+DEFAULT_CELL_LEADING = 12   # leading de las celdas de Table si el estilo no lo fija
+
+_lock = threading.Lock()
+_plans = {}     # ruta -> (mtime, Plan)
+_blocks = {}    # nombre -> función(c, ctx, **params)
+
+
+def block(name):
+    # Registra un bloque dibujado en Python para lo que no es un campo
+    # suelto (p. ej. totales por moneda). El layout lo usa por nombre.
+    def register(fn):
+        _blocks[name] = fn
+        return fn
+    return register
+
+# ----------------------------------------------------------------------
+# Textos con {campos}
+# ----------------------------------------------------------------------
+
+def _value(ctx, path):
+    value = ctx
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+        if value is None:
+            return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v) for v in value)
+    return str(value)
+
+
+def _compile_text(template: str):
+    # "{cliente}" o "Tipo de Operación: {operation_type}"; los campos
+    # anidados se escriben {commercial[name]}. Faltantes y None -> "".
+    pieces = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if spec or conversion:
+            raise ValueError(f"Formato no soportado en el layout: {template!r}")
+        path = tuple(field.replace("]", "").replace("[", ".").split(".")) if field else None
+        pieces.append((literal, path))
+
+    if len(pieces) == 1 and not pieces[0][0] and pieces[0][1]:
+        path = pieces[0][1]
+        return lambda ctx: _value(ctx, path)
+    return lambda ctx: "".join(literal + (_value(ctx, path) if path else "") for literal, path in pieces)
+
+
+def _compile_when(field):
+    if not field:
+        return None
+    path = tuple(field.split("."))
+
+    def check(ctx):
+        return _value(ctx, path).strip() not in ("", "None")
+    return check
+
+# ----------------------------------------------------------------------
+# Operaciones compiladas: (función, argumentos)
+# ----------------------------------------------------------------------
+
+def _op_font(c, ctx, name, size):
+    c.setFont(name, size)
+
+
+def _op_text(c, ctx, x, y, render, upper, when):
+    if when and not when(ctx):
+        return
+    text = render(ctx)
+    c.drawString(x, y, text.upper() if upper else text)
+
+
+def _op_wrap(c, ctx, x, y, render, upper, leading, font, size, fit):
+    text = render(ctx)
+    lines, fitted = fit_lines(text.upper() if upper else text, font, size, **fit)
+    if fitted != size:
+        c.setFont(font, fitted)
+    for i, line in enumerate(lines):
+        c.drawString(x, y - i * leading, line)
+    if fitted != size:
+        c.setFont(font, size)
+
+
+def _op_lines(c, ctx, x, y, leading, items):
+    offset = 0
+    for render, when in items:
+        if when and not when(ctx):
+            continue
+        c.drawString(x, y - offset, render(ctx))
+        offset += leading
+
+
+def _op_flow(c, ctx, x, y, leading, items):
+    # Cada elemento sigue debajo del anterior, aunque ocupe varias líneas
+    for font, size, render, upper, fit in items:
+        text = render(ctx)
+        if upper:
+            text = text.upper()
+        if fit:
+            lines, fitted = fit_lines(text, font, size, **fit)
+        else:
+            lines, fitted = [text], size
+        c.setFont(font, fitted)
+        for line in lines:
+            c.drawString(x, y, line)
+            y -= leading
+
+
+def _op_inline(c, ctx, x, y, segments):
+    for font, size, render, upper in segments:
+        text = render(ctx)
+        if upper:
+            text = text.upper()
+        c.setFont(font, size)
+        c.drawString(x, y, text)
+        x += text_width(text, font, size)
+
+
+def _op_block(c, ctx, fn, params):
+    fn(c, ctx, **params)
+
+
+def _font(spec, default=None):
+    font = spec.get("font", default)
+    return FONTS.get(font, font)
+
+
+def _compile_fit(spec: dict):
+    # Parámetros de fit_lines: ancho en puntos, máximo de líneas, tamaño
+    # mínimo al achicar y si se respetan los saltos de línea.
+    if "max_width" not in spec:
+        return None
+    return {
+        "max_width": spec["max_width"],
+        "max_lines": spec.get("max_lines"),
+        "min_size": spec.get("min_size"),
+        "keep_newlines": spec.get("mode", "paragraphs") == "paragraphs",
+    }
+
+
+def _compile_ops(specs: list) -> list:
+    ops = []
+    current = None      # (fuente, tamaño) activa, para no repetir setFont
+
+    def use_font(spec):
+        nonlocal current
+        if "font" not in spec and "size" not in spec:
+            return
+        font = (_font(spec, current[0] if current else None), spec.get("size", current[1] if current else None))
+        if font != current:
+            ops.append((_op_font, font))
+            current = font
+
+    for spec in specs:
+        kind = spec["kind"]
+        if kind == "text":
+            use_font(spec)
+            ops.append((_op_text, (spec["x"], spec["y"], _compile_text(spec["text"]),
+                                   spec.get("upper", False), _compile_when(spec.get("when")))))
+        elif kind == "wrap":
+            use_font(spec)
+            if current is None or "max_width" not in spec:
+                raise ValueError(f"Falta la fuente o max_width para {spec['text']!r} en el layout")
+            ops.append((_op_wrap, (spec["x"], spec["y"], _compile_text(spec["text"]), spec.get("upper", False),
+                                   spec["leading"], current[0], current[1], _compile_fit(spec))))
+        elif kind == "lines":
+            use_font(spec)
+            items = [(_compile_text(item["text"]), _compile_when(item.get("when"))) for item in spec["items"]]
+            ops.append((_op_lines, (spec["x"], spec["y"], spec["leading"], items)))
+        elif kind == "flow":
+            items = []
+            for item in spec["items"]:
+                items.append((_font(item), item["size"], _compile_text(item["text"]), item.get("upper", False),
+                              _compile_fit(item)))
+            ops.append((_op_flow, (spec["x"], spec["y"], spec["leading"], items)))
+            current = None      # el último elemento puede quedar achicado
+        elif kind == "inline":
+            segments = [(_font(s), s["size"], _compile_text(s["text"]), s.get("upper", False)) for s in spec["segments"]]
+            ops.append((_op_inline, (spec["x"], spec["y"], segments)))
+            current = segments[-1][:2] if segments else current
+        elif kind == "block":
+            if spec["name"] not in _blocks:
+                raise ValueError(f"Bloque desconocido en el layout: {spec['name']}")
+            use_font(spec)
+            ops.append((_op_block, (_blocks[spec["name"]], spec.get("params", {}))))
+            current = None      # el bloque puede cambiar la fuente
+        else:
+            raise ValueError(f"Operación desconocida en el layout: {kind}")
+    return ops
+
+
+def replay(c, ops, ctx):
+    for fn, args in ops:
+        fn(c, ctx, *args)
+
+# ----------------------------------------------------------------------
+# Tabla
+# ----------------------------------------------------------------------
+
+DEFAULT_PADDING = 6         # LEFT/RIGHTPADDING por defecto de Table
+
+
+class TableRenderer:
+    # Tabla de columnas fijas dibujada directo en el canvas, con la misma
+    # geometría que reportlab Table para celdas de texto (ALIGN/VALIGN,
+    # paddings, leading por defecto 12). Las posiciones de columna y el
+    # alto de fila se calculan al compilar el layout; cada render es un
+    # único objeto de texto con un Tm + Tj por celda.
+
+    def __init__(self, spec: dict):
+        style = spec.get("style", {})
+        self.font = _font(style, "regular")
+        self.size = style.get("size", 10)
+        self.leading = style.get("leading", DEFAULT_CELL_LEADING)
+        self.top = style.get("top_padding", 3)
+        self.bottom = style.get("bottom_padding", 3)
+        left = style.get("left_padding", DEFAULT_PADDING)
+        right = style.get("right_padding", DEFAULT_PADDING)
+        self.align = style.get("align", "CENTER")
+        self.valign = style.get("valign", "MIDDLE")
+        if self.align not in ("LEFT", "CENTER", "CENTRE", "RIGHT"):
+            raise ValueError(f"Alineación no soportada en el layout: {self.align}")
+        if self.valign not in ("TOP", "MIDDLE", "BOTTOM"):
+            raise ValueError(f"Alineación vertical no soportada en el layout: {self.valign}")
+
+        self.row_height = self.leading + self.top + self.bottom
+        self.anchors = []
+        col_x = spec.get("x", 0)
+        for width in spec["col_widths"]:
+            if self.align == "LEFT":
+                self.anchors.append(col_x + left)
+            elif self.align == "RIGHT":
+                self.anchors.append(col_x + width - right)
+            else:
+                self.anchors.append(col_x + (width + left - right) * 0.5)
+            col_x += width
+        # Fracción del ancho del texto que se corre a la izquierda
+        self.shift = {"LEFT": 0.0, "RIGHT": 1.0}.get(self.align, 0.5)
+
+    def _baseline(self, row_y, row_height, lines):
+        # Igual que Table._drawCell para celdas de texto
+        if self.valign == "TOP":
+            return row_y + row_height - self.top - self.size
+        if self.valign == "BOTTOM":
+            return row_y + self.bottom + lines * self.leading - self.size
+        return row_y + (self.bottom + row_height - self.top + lines * self.leading) / 2.0 - self.size
+
+    def draw(self, c, rows, y_top):
+        if not rows:
+            return
+        widths = glyph_widths(self.font)
+        scale = self.size / 1000
+        shift = self.shift
+        anchors = self.anchors
+
+        c.saveState()
+        c.setFillGray(0)
+        text = c.beginText()
+        text.setFont(self.font, self.size, self.leading)
+        set_origin, text_out = text.setTextOrigin, text.textOut
+
+        y = y_top
+        single_offset = self._baseline(0, self.row_height, 1)
+        for row in rows:
+            if any("\n" in cell for cell in row):
+                y = self._draw_multiline(text, row, y, widths, scale)
+                continue
+            y -= self.row_height
+            baseline = y + single_offset
+            for anchor, cell in zip(anchors, row):
+                if cell:
+                    set_origin(anchor - shift * scale * sum(widths[ch] for ch in cell), baseline)
+                    text_out(cell)
+
+        c.drawText(text)
+        c.restoreState()
+
+    def _draw_multiline(self, text, row, y, widths, scale):
+        cells = [cell.split("\n") for cell in row]
+        row_height = max(len(lines) for lines in cells) * self.leading + self.top + self.bottom
+        y -= row_height
+        for anchor, lines in zip(self.anchors, cells):
+            baseline = self._baseline(y, row_height, len(lines))
+            for line in lines:
+                if line:
+                    text.setTextOrigin(anchor - self.shift * scale * sum(widths[ch] for ch in line), baseline)
+                    text.textOut(line)
+                baseline -= self.leading
+        return y
+
+# ----------------------------------------------------------------------
+# Plan de una familia de plantillas
+# ----------------------------------------------------------------------
+
+class Plan:
+    def __init__(self, spec: dict):
+        self.variants = spec["variants"]
+        self.table = TableRenderer(spec["table"])
+
+        pages = spec["pages"]
+        first = pages["first"]
+        continuation = pages.get("continuation")
+        self.first_ops = _compile_ops(first.get("ops", []))
+        self.first_top = first["table_top"]
+        self.first_rows = first.get("max_rows")
+        self.last_ops = _compile_ops(pages.get("last", {}).get("ops", []))
+        if continuation:
+            self.continuation_ops = _compile_ops(continuation.get("ops", []))
+            self.continuation_top = continuation["table_top"]
+            self.continuation_rows = int((continuation["table_top"] - continuation["table_bottom"]) // self.table.row_height)
+        else:
+            self.continuation_ops = None
+
+    def paginate(self, count: int) -> list[tuple[int, int]]:
+        # (inicio, fin) de las filas de cada página
+        if self.first_rows is None or self.continuation_ops is None:
+            return [(0, count)]
+        pages = [(0, min(count, self.first_rows))]
+        for start in range(self.first_rows, count, self.continuation_rows):
+            pages.append((start, min(count, start + self.continuation_rows)))
+        return pages
+
+    def page_drawer(self, ctx: dict, rows: list):
+        # draw_page(c, page_no) y el número de páginas con datos. Las
+        # páginas siguientes de la plantilla (condiciones) van sin datos.
+        pages = self.paginate(len(rows))
+
+        def draw_page(c, page_no):
+            if page_no >= len(pages):
+                return
+            start, end = pages[page_no]
+            if page_no == 0:
+                replay(c, self.first_ops, ctx)
+                top = self.first_top
+            else:
+                replay(c, self.continuation_ops, ctx)
+                top = self.continuation_top
+            self.table.draw(c, rows[start:end], top)
+            if page_no == len(pages) - 1:
+                replay(c, self.last_ops, ctx)
+
+        return draw_page, len(pages)
+
+    def template_for(self, variant: str, pages: int):
+        # Primera plantilla de la variante que admite `pages` páginas con
+        # datos; devuelve su ruta y los índices de página a usar.
+        for template in self.variants[variant]["templates"]:
+            if pages <= template.get("max_pages", pages):
+                indexes = [template.get("first", 0)]
+                indexes += [template["continuation"]] * (pages - 1) if pages > 1 else []
+                indexes += template.get("trailing", [])
+                return template["path"], indexes
+        raise ValueError(f"Ninguna plantilla de '{variant}' admite {pages} páginas")
+
+
+def layout_path(name: str) -> str:
+    return os.path.join(LAYOUT_DIR, f"{name}.json")
+
+
+def load_layout(name: str) -> Plan:
+    path = layout_path(name)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No se encontró el layout: {path}")
+
+    cached = _plans.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _lock:
+        cached = _plans.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, encoding="utf-8") as f:
+            plan = Plan(json.load(f))
+        _plans[path] = (mtime, plan)
+        return plan
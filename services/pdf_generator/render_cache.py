@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from services.surcharges import as_json
+
+# ----------------------------------------------------------------------
+# Caché de PDFs generados.
+#
+# La clave es un sha256 de todo lo que cambia el resultado: el payload de
+# la orden, la variante, el modo de render, la fecha que se imprime y la
+# versión (mtime + tamaño) del layout, las plantillas y las fuentes. Dos
+# clics seguidos en "Generar PDFs" sin cambios devuelven los mismos bytes
+# sin volver a dibujar.
+#
+# Dos niveles, ambos LRU acotados en bytes: memoria del proceso y disco
+# (DISK_DIR, sobrevive a reinicios y se comparte entre procesos).
+# ----------------------------------------------------------------------
+
+CACHE_VERSION = 1           # subir si cambia el código de dibujo
+
+MEMORY_MAX_BYTES = 64 * 1024 * 1024
+DISK_MAX_BYTES = 256 * 1024 * 1024
+DISK_DIR = "resources/cache/pdf"
+
+
+def file_version(paths) -> list:
+    version = []
+    for path in sorted(set(paths)):
+        try:
+            st = os.stat(path)
+            version.append([path, st.st_mtime_ns, st.st_size])
+        except FileNotFoundError:
+            version.append([path, None, None])
+    return version
+
+
+def _json_default(value):
+    try:
+        return as_json(value)
+    except TypeError:
+        return str(value)
+
+
+def make_key(kind: str, payload: dict, files, **extra) -> str:
+    # `extra`: variante, modo, etc. La fecha de hoy se agrega siempre
+    # porque va impresa en el PDF.
+    material = {
+        "cache_version": CACHE_VERSION,
+        "kind": kind,
+        "date": datetime.today().strftime("%Y-%m-%d"),
+        "files": file_version(files),
+        "extra": extra,
+        "payload": payload,
+    }
+    encoded = json.dumps(material, sort_keys=True, default=_json_default, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+# ----------------------------------------------------------------------
+# Niveles
+# ----------------------------------------------------------------------
+
+class MemoryLRU:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+class DiskLRU:
+    # Un archivo por clave; el mtime marca el último uso y al escribir se
+    # borran los más viejos hasta quedar bajo max_bytes.
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(value)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(".pdf"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                return
+            for name in os.listdir(self.directory):
+                if name.endswith(".pdf"):
+                    os.remove(os.path.join(self.directory, name))
+
+
+_memory = MemoryLRU(MEMORY_MAX_BYTES)
+_disk = DiskLRU(DISK_DIR, DISK_MAX_BYTES)
+
+_stats_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats() -> dict:
+    with _stats_lock:
+        result = dict(_stats)
+    result["memory_bytes"] = _memory.size
+    lookups = result["memory_hits"] + result["disk_hits"] + result["misses"]
+    result["hit_rate"] = (lookups - result["misses"]) / lookups if lookups else 0.0
+    return result
+
+
+def clear():
+    _memory.clear()
+    _disk.clear()
+
+
+def lookup(key: str):
+    # None si la clave no está en ningún nivel
+    value = _memory.get(key)
+    if value is not None:
+        _count("memory_hits")
+        return value
+
+    try:
+        value = _disk.get(key)
+    except OSError as e:
+        print(f"⚠️ No se pudo leer la caché de PDFs: {e}")
+        value = None
+    if value is not None:
+        _count("disk_hits")
+        _memory.put(key, value)
+        return value
+
+    _count("misses")
+    return None
+
+
+def store(key: str, value: bytes):
+    _memory.put(key, value)
+    try:
+        _disk.put(key, value)
+    except OSError as e:
+        # Sin disco se sigue sirviendo desde memoria
+        print(f"⚠️ No se pudo escribir la caché de PDFs: {e}")
+
+
+def get_or_render(key: str, render) -> bytes:
+    value = lookup(key)
+    if value is None:
+        value = render()
+        store(key, value)
+    return value
@@ -0,0 +1,326 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from services.pdf_generator import render_cache
+from services.pdf_generator.generate_anticipo import LAYOUT as ANTICIPO_LAYOUT
+from services.pdf_generator.generate_anticipo import cache_key as anticipo_key, generate_pdf
+from services.pdf_generator.generate_preorden import LAYOUT as PREORDEN_LAYOUT
+from services.pdf_generator.generate_preorden import cache_key as preorden_key, generate_archives
+from services.pdf_generator.layout import load_layout
+from services.pdf_generator.resources import get_template, resolve_mode, template_forms
+
+# ----------------------------------------------------------------------
+# Procesos trabajadores para generar PDFs fuera del hilo del script.
+#
+# Dibujar un PDF es CPU puro y con el GIL bloquea a todas las sesiones de
+# Streamlit del servidor. Aquí cada render corre en un proceso aparte: el
+# payload de la orden viaja serializado (pickle) y vuelven los bytes del
+# PDF. Ventas y costos se envían juntos y se dibujan en paralelo.
+#
+# La caché de PDFs (render_cache) se consulta y se llena en el proceso
+# principal; a los trabajadores sólo llegan los que no estaban.
+#
+# La cola está acotada a MAX_PENDING trabajos: si está llena, el envío
+# espera hasta SUBMIT_TIMEOUT y luego falla con RenderError, igual que un
+# trabajo que tarda más de JOB_TIMEOUT. Con PDF_RENDER_WORKERS=0 (o si no
+# se pueden crear procesos) se dibuja en el hilo que llama.
+# ----------------------------------------------------------------------
+
+WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", min(4, max(2, os.cpu_count() or 1))))
+MAX_PENDING = int(os.environ.get("PDF_RENDER_MAX_PENDING", max(1, WORKERS) * 4))
+SUBMIT_TIMEOUT = 30.0   # segundos esperando un lugar en la cola
+JOB_TIMEOUT = 120.0     # segundos esperando el resultado de un trabajo
+MAX_TIMINGS = 500       # trabajos recientes que se guardan para metrics()
+
+# forkserver evita hacer fork de un servidor con hilos; el módulo se
+# precarga para que cada trabajador arranque con fuentes y layouts listos.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _context = multiprocessing.get_context("forkserver")
+    _context.set_forkserver_preload([__name__])
+else:
+    _context = multiprocessing.get_context("spawn")
+
+_pool_lock = threading.Lock()
+_pool = None
+_warmed = False
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+_metrics_lock = threading.Lock()
+_counters = {"submitted": 0, "completed": 0, "failed": 0, "inline": 0, "cache_hits": 0}
+_pending = 0
+_timings = deque(maxlen=MAX_TIMINGS)
+
+
+class RenderError(RuntimeError):
+    # Cola llena o trabajo sin respuesta: las vistas lo muestran con st.error
+    pass
+
+
+# ------------------------- lado del trabajador --------------------------
+
+def _init_worker():
+    # Streamlit avisa que no hay runtime al importar utils.helpers
+    import streamlit.logger
+    streamlit.logger.set_log_level(logging.ERROR)
+
+    # Plantillas parseadas antes del primer trabajo
+    mode = resolve_mode(None)
+    for name in (PREORDEN_LAYOUT, ANTICIPO_LAYOUT):
+        for cfg in load_layout(name).variants.values():
+            for template in cfg["templates"]:
+                if mode == "xobject":
+                    template_forms(template["path"])
+                else:
+                    get_template(template["path"])
+
+
+def _ping():
+    return os.getpid()
+
+
+def _run_job(kind: str, payload: dict, variant: str | None, mode: str):
+    # Devuelve (pdf, inicio, fin, pid); los tiempos son time.time() para
+    # poder compararlos con los del proceso principal.
+    started = time.time()
+    if kind == PREORDEN_LAYOUT:
+        pdf = generate_archives(payload, variant, mode, use_cache=False)
+    else:
+        pdf = generate_pdf(payload, mode=mode, use_cache=False)
+    return pdf, started, time.time(), os.getpid()
+
+
+# -------------------------------- pool ----------------------------------
+
+def _get_pool():
+    global _pool
+    if WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=_context, initializer=_init_worker)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ No se pudo iniciar el pool de PDFs, se genera en el hilo actual: {e}")
+                return None
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool, _warmed
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _warmed = None, False
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _warm_up():
+    pool = _get_pool()
+    if pool is not None:
+        for _ in range(WORKERS):
+            pool.submit(_ping)
+
+
+def start():
+    # Arranca los procesos en segundo plano para que el primer clic en
+    # "Generar PDFs" no pague el arranque. Idempotente.
+    global _warmed
+    if WORKERS <= 0:
+        return
+    with _pool_lock:
+        if _warmed:
+            return
+        _warmed = True
+    threading.Thread(target=_warm_up, name="pdf-render-warmup", daemon=True).start()
+
+
+def shutdown():
+    global _pool, _warmed
+    with _pool_lock:
+        pool, _pool, _warmed = _pool, None, False
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown)
+
+
+# ------------------------------ métricas --------------------------------
+
+def _count(name, delta=1):
+    with _metrics_lock:
+        _counters[name] += delta
+
+
+def _enqueued():
+    global _pending
+    with _metrics_lock:
+        _counters["submitted"] += 1
+        _pending += 1
+
+
+def _record(job, ok, started=None, finished=None, pid=None):
+    global _pending
+    now = time.time()
+    with _metrics_lock:
+        _pending -= 1
+        _counters["completed" if ok else "failed"] += 1
+        _timings.append({
+            "kind": job.kind,
+            "variant": job.variant,
+            "ok": ok,
+            "pid": pid,
+            "wait_ms": round(((started or now) - job.queued_at) * 1000, 1),
+            "render_ms": round(((finished or now) - (started or now)) * 1000, 1),
+            "total_ms": round((now - job.queued_at) * 1000, 1),
+        })
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def metrics() -> dict:
+    with _metrics_lock:
+        result = dict(_counters)
+        result["pending"] = _pending
+        jobs = list(_timings)
+    result["workers"] = WORKERS
+    result["max_pending"] = MAX_PENDING
+    result["pool_running"] = _pool is not None
+    for field in ("wait_ms", "render_ms", "total_ms"):
+        values = [j[field] for j in jobs if j["ok"]]
+        result[f"{field}_avg"] = round(sum(values) / len(values), 1) if values else 0.0
+        result[f"{field}_p95"] = _percentile(values, 0.95)
+    result["recent"] = jobs[-20:]
+    return result
+
+
+# ------------------------------ trabajos --------------------------------
+
+class RenderJob:
+    def __init__(self, kind, payload, variant, mode):
+        self.kind = kind
+        self.payload = payload
+        self.variant = variant
+        self.mode = mode
+        self.queued_at = time.time()
+        self.future = None
+        self._pool = None
+        self._inline = None
+
+    def _done(self, future):
+        _slots.release()
+        if future.cancelled() or future.exception() is not None:
+            _record(self, False)
+            return
+        _, started, finished, pid = future.result()
+        _record(self, True, started, finished, pid)
+
+    def _render_inline(self):
+        _count("inline")
+        started = time.time()
+        try:
+            pdf = _run_job(self.kind, self.payload, self.variant, self.mode)[0]
+        except Exception:
+            _record(self, False, started)
+            raise
+        _record(self, True, started, time.time(), os.getpid())
+        return pdf
+
+    def result(self) -> bytes:
+        if self._inline is not None:
+            return self._inline
+        if self.future is None:
+            self._inline = self._render_inline()
+            return self._inline
+        try:
+            return self.future.result(timeout=JOB_TIMEOUT)[0]
+        except FutureTimeout:
+            # Si no arrancó se saca de la cola; si ya corre, su lugar se
+            # libera cuando termine (_done)
+            self.future.cancel()
+            raise RenderError(f"El PDF tardó más de {JOB_TIMEOUT:.0f} s en generarse, intente de nuevo") from None
+        except BrokenProcessPool as e:
+            # Un trabajador murió (p. ej. sin memoria): se recrea el pool
+            # en el próximo envío y este trabajo se dibuja aquí.
+            print(f"⚠️ El pool de PDFs se cayó, se genera en el hilo actual: {e}")
+            _discard_pool(self._pool)
+            _enqueued()
+            self.future = None
+            return self.result()
+
+
+def submit(kind: str, payload: dict, variant: str | None = None, mode: str | None = None) -> RenderJob:
+    # kind: "preorden" (con variant "ventas"/"costos") o "anticipo"
+    job = RenderJob(kind, payload, variant, resolve_mode(mode))
+    _enqueued()
+
+    pool = _get_pool()
+    if pool is None:
+        return job
+
+    if not _slots.acquire(timeout=SUBMIT_TIMEOUT):
+        _record(job, False)
+        raise RenderError(f"Cola de PDFs llena ({MAX_PENDING} trabajos pendientes), intente de nuevo")
+    try:
+        job.future = pool.submit(_run_job, kind, payload, variant, job.mode)
+    except (BrokenProcessPool, RuntimeError) as e:
+        _slots.release()
+        print(f"⚠️ No se pudo enviar el PDF al pool, se genera en el hilo actual: {e}")
+        _discard_pool(pool)
+        return job
+    job._pool = pool
+    job.future.add_done_callback(job._done)
+    return job
+
+
+def _render_all(payload: dict, jobs: dict, use_cache: bool) -> dict:
+    # jobs: nombre -> (kind, variant, mode, clave de caché o None)
+    results = {}
+    submitted = {}
+    for name, (kind, variant, mode, key) in jobs.items():
+        pdf = render_cache.lookup(key) if use_cache else None
+        if pdf is not None:
+            _count("cache_hits")
+            results[name] = pdf
+        else:
+            submitted[name] = (key, submit(kind, payload, variant, mode))
+
+    for name, (key, job) in submitted.items():
+        pdf = job.result()
+        if use_cache:
+            render_cache.store(key, pdf)
+        results[name] = pdf
+    return results
+
+
+def render_preorden(order_info: dict, variants=("ventas", "costos"), mode: str | None = None, use_cache: bool = True) -> dict:
+    # {variante: bytes}; todas las variantes se dibujan en paralelo
+    mode = resolve_mode(mode)
+    # Las variantes inválidas fallan aquí y no dentro del trabajador
+    known = load_layout(PREORDEN_LAYOUT).variants
+    for variant in variants:
+        if variant not in known:
+            raise ValueError(f"Variant desconocida: {variant}")
+
+    jobs = {
+        variant: (PREORDEN_LAYOUT, variant, mode, preorden_key(order_info, variant, mode) if use_cache else None)
+        for variant in variants
+    }
+    return _render_all(order_info, jobs, use_cache)
+
+
+def render_anticipo(data: dict, mode: str | None = None, use_cache: bool = True) -> bytes:
+    mode = resolve_mode(mode)
+    key = anticipo_key(data, mode=mode) if use_cache else None
+    return _render_all(data, {"anticipo": (ANTICIPO_LAYOUT, None, mode, key)}, use_cache)["anticipo"]
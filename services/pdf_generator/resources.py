@@ -0,0 +1,227 @@
+import os
+import threading
+from io import BytesIO
+
+import pdfrw
+import PyPDF2
+from pdfrw.buildxobj import pagexobj
+from pdfrw.toreportlab import makerl
+from PyPDF2 import PageObject
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from services.pdf_generator.text_layout import reset_metrics
+
+# ----------------------------------------------------------------------
+# Registro de plantillas y fuentes compartido por todo el proceso.
+#
+# Cada plantilla PDF y cada fuente TTF se parsea una sola vez; las
+# peticiones sólo reciben copias ligeras de las páginas ya cargadas.
+# Si el archivo cambia en disco (mtime distinto) se vuelve a cargar en
+# la siguiente petición, sin reiniciar el servidor.
+# ----------------------------------------------------------------------
+
+FONT_REGULAR = "OpenSauce"
+FONT_BOLD    = "OpenSauceBold"
+
+FONT_FILES = {
+    FONT_REGULAR: "resources/fonts/OpenSauceSans-Regular.ttf",
+    FONT_BOLD:    "resources/fonts/OpenSauceSans-Bold.ttf",
+}
+
+_lock = threading.Lock()
+_fonts = {}        # nombre -> mtime registrado
+_templates = {}    # ruta   -> (mtime, PdfReader)
+_forms = {}        # ruta   -> (mtime, TemplateForms)
+
+# "xobject": cada página de la plantilla se dibuja como form XObject bajo
+# el canvas de reportlab y el PDF se serializa una sola vez.
+# "merge": overlay aparte + PyPDF2 merge_page (modo anterior).
+RENDER_MODES = ("xobject", "merge")
+RENDER_MODE = os.environ.get("PDF_RENDER_MODE", "xobject")
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def register_fonts():
+    for name, path in FONT_FILES.items():
+        mtime = _mtime(path)
+        if _fonts.get(name) == mtime:
+            continue
+        with _lock:
+            if _fonts.get(name) == mtime:
+                continue
+            if mtime is None:
+                print(f"⚠️ Advertencia: La fuente '{name}' no se encontró. Se usará 'Helvetica' como alternativa.")
+            else:
+                pdfmetrics.registerFont(TTFont(name, path))
+                reset_metrics(name)
+            _fonts[name] = mtime
+
+
+def _preload(obj, seen):
+    # Resuelve todo el árbol de objetos de la página una sola vez. Así las
+    # copias posteriores sólo leen objetos ya cacheados en el reader y no
+    # vuelven a hacer seek sobre el stream compartido entre sesiones.
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key in seen:
+            return
+        seen.add(key)
+        obj = obj.get_object()
+    if isinstance(obj, DictionaryObject):
+        for key, value in obj.items():
+            if key != "/Parent":
+                _preload(value, seen)
+    elif isinstance(obj, ArrayObject):
+        for value in obj:
+            _preload(value, seen)
+
+
+def _load_template(path):
+    mtime = _mtime(path)
+    if mtime is None:
+        raise FileNotFoundError(f"No se encontró la plantilla: {path}")
+
+    cached = _templates.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _lock:
+        cached = _templates.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        # Se lee el archivo completo a memoria para no mantenerlo abierto
+        # ni depender de él si lo reemplazan mientras está en uso.
+        with open(path, "rb") as f:
+            reader = PyPDF2.PdfReader(BytesIO(f.read()))
+        seen = set()
+        for page in reader.pages:
+            _preload(page, seen)
+        _templates[path] = (mtime, reader)
+        return reader
+
+
+def get_template(path) -> PyPDF2.PdfReader:
+    return _load_template(path)
+
+
+def template_pages(path, page_indexes=None):
+    # Cada copia es un diccionario nuevo que apunta a los objetos ya
+    # cargados de la plantilla: estamparle un overlay con merge_page no
+    # modifica la versión en caché. `page_indexes` admite índices
+    # repetidos (p. ej. páginas de continuación).
+    reader = _load_template(path)
+    if page_indexes is None:
+        page_indexes = range(len(reader.pages))
+
+    copies = []
+    for idx in page_indexes:
+        page = PageObject(reader)
+        page.update(reader.pages[idx])
+        copies.append(page)
+    return copies
+
+
+def template_page_count(path) -> int:
+    return len(_load_template(path).pages)
+
+
+def resolve_mode(mode=None) -> str:
+    mode = mode or RENDER_MODE
+    if mode not in RENDER_MODES:
+        raise ValueError(f"Modo de render desconocido: {mode}")
+    return mode
+
+# ----------------------------------------------------------------------
+# Plantillas como form XObjects (pdfrw)
+# ----------------------------------------------------------------------
+
+class TemplateForms:
+    # Las páginas de la plantilla convertidas a form XObject una sola vez.
+    #
+    # pdfrw guarda en cada objeto (derived_rl_obj) el equivalente de
+    # reportlab por documento. Esos diccionarios se crean aquí, al cargar,
+    # para que dos renders simultáneos no se los pisen, y release() borra
+    # las entradas del documento terminado para no retenerlo en memoria.
+
+    def __init__(self, reader):
+        self.pages = [pagexobj(page) for page in reader.pages]
+        self._objects = []
+        seen = set()
+        for form in self.pages:
+            self._collect(form, seen)
+
+    def _collect(self, obj, seen):
+        if id(obj) in seen:
+            return
+        if isinstance(obj, pdfrw.PdfDict):
+            seen.add(id(obj))
+            obj.private.derived_rl_obj = {}
+            self._objects.append(obj)
+            for key, value in obj.iteritems():
+                if key != "/Parent":
+                    self._collect(value, seen)
+        elif isinstance(obj, pdfrw.PdfArray):
+            seen.add(id(obj))
+            obj.derived_rl_obj = {}
+            self._objects.append(obj)
+            for value in obj:
+                self._collect(value, seen)
+
+    def release(self, rldoc):
+        for obj in self._objects:
+            obj.derived_rl_obj.pop(rldoc, None)
+
+
+def template_forms(path) -> TemplateForms:
+    mtime = _mtime(path)
+    if mtime is None:
+        raise FileNotFoundError(f"No se encontró la plantilla: {path}")
+
+    cached = _forms.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _lock:
+        cached = _forms.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as f:
+            forms = TemplateForms(pdfrw.PdfReader(BytesIO(f.read())))
+        _forms[path] = (mtime, forms)
+        return forms
+
+
+def render_on_template(path, page_indexes, draw_page) -> bytes:
+    # Dibuja cada página de `page_indexes` como fondo y encima llama a
+    # draw_page(c, i) con el índice de la página de salida. Todo en un
+    # solo canvas: no hay overlay intermedio ni merge.
+    forms = template_forms(path)
+    if page_indexes is None:
+        page_indexes = range(len(forms.pages))
+
+    output = BytesIO()
+    c = canvas.Canvas(output)
+    try:
+        for i, idx in enumerate(page_indexes):
+            form = forms.pages[idx]
+            x0, y0, x1, y1 = (float(v) for v in form.BBox)
+            c.setPageSize((x1 - x0, y1 - y0))
+            c.saveState()
+            c.translate(-x0, -y0)
+            c.doForm(makerl(c, form))
+            c.restoreState()
+            draw_page(c, i)
+            c.showPage()
+        c.save()
+    finally:
+        forms.release(c._doc)
+    return output.getvalue()
@@ -0,0 +1,150 @@
+from functools import lru_cache
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+# ----------------------------------------------------------------------
+# Medición y partido de texto compartido por los generadores.
+#
+# El ancho de cada carácter se mide una sola vez por fuente (tabla en
+# unidades de 1/1000 de punto) y luego se suma: medir una palabra es una
+# suma de búsquedas en un dict y partir un párrafo es lineal en su largo.
+# Con fuentes TTF el resultado es el mismo que stringWidth de reportlab.
+# ----------------------------------------------------------------------
+
+ELLIPSIS = "…"
+SHRINK_STEP = 0.5
+
+
+class _GlyphWidths(dict):
+    def __init__(self, font):
+        super().__init__()
+        self.font = font
+
+    def __missing__(self, char):
+        width = self[char] = stringWidth(char, self.font, 1000)
+        return width
+
+
+_glyph_widths = {}     # fuente -> _GlyphWidths
+
+
+def glyph_widths(font: str) -> _GlyphWidths:
+    widths = _glyph_widths.get(font)
+    if widths is None:
+        widths = _glyph_widths.setdefault(font, _GlyphWidths(font))
+    return widths
+
+
+def reset_metrics(font: str | None = None):
+    # Se llama al (re)registrar una fuente: sus anchos pueden cambiar
+    if font is None:
+        _glyph_widths.clear()
+    else:
+        _glyph_widths.pop(font, None)
+
+
+def text_width(text: str, font: str, size: float) -> float:
+    widths = glyph_widths(font)
+    return sum(widths[ch] for ch in text) * size / 1000
+
+# ----------------------------------------------------------------------
+# Partido de líneas
+# ----------------------------------------------------------------------
+
+def _split_long_word(word, widths, limit):
+    # Palabra más ancha que la línea: se corta por caracteres
+    pieces = []
+    start = 0
+    used = 0.0
+    for i, ch in enumerate(word):
+        w = widths[ch]
+        if used + w > limit and i > start:
+            pieces.append(word[start:i])
+            start, used = i, 0.0
+        used += w
+    pieces.append(word[start:])
+    return pieces
+
+
+def _wrap_paragraph(paragraph, widths, limit, space):
+    lines = []
+    line = []
+    used = 0.0
+    for word in paragraph.split():
+        w = sum(widths[ch] for ch in word)
+        if w > limit:
+            pieces = _split_long_word(word, widths, limit)
+            word = pieces.pop()
+            if line:
+                lines.append(" ".join(line))
+            lines.extend(pieces)
+            line, used = [], 0.0
+            w = sum(widths[ch] for ch in word)
+
+        if line and used + space + w <= limit:
+            line.append(word)
+            used += space + w
+        elif line:
+            lines.append(" ".join(line))
+            line, used = [word], w
+        else:
+            line, used = [word], w
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
+def wrap_lines(text: str, font: str, size: float, max_width: float, keep_newlines: bool = True) -> list[str]:
+    # Con keep_newlines cada salto de línea empieza una línea nueva y los
+    # párrafos vacíos se conservan como líneas en blanco.
+    widths = glyph_widths(font)
+    limit = max_width * 1000 / size
+    space = widths[" "]
+    if not keep_newlines:
+        return _wrap_paragraph(text, widths, limit, space)
+
+    lines = []
+    for paragraph in text.split("\n"):
+        lines.extend(_wrap_paragraph(paragraph, widths, limit, space) or [""])
+    return lines
+
+
+def truncate(line: str, font: str, size: float, max_width: float) -> str:
+    # Recorta el final de la línea para que quepa con "…"
+    widths = glyph_widths(font)
+    limit = max_width * 1000 / size - widths[ELLIPSIS]
+    used = 0.0
+    for i, ch in enumerate(line):
+        used += widths[ch]
+        if used > limit:
+            return line[:i].rstrip() + ELLIPSIS
+    return line.rstrip() + ELLIPSIS
+
+
+def fit_lines(text: str, font: str, size: float, max_width: float, max_lines: int | None = None,
+              min_size: float | None = None, keep_newlines: bool = True) -> tuple[list[str], float]:
+    # Parte el texto y, si no cabe en max_lines, reduce la fuente de a
+    # SHRINK_STEP hasta min_size; si aún no cabe, corta la última línea
+    # con "…". Devuelve las líneas y el tamaño de fuente a usar.
+    lines = wrap_lines(text, font, size, max_width, keep_newlines)
+    if not max_lines or len(lines) <= max_lines:
+        return lines, size
+
+    if min_size is not None:
+        while size - SHRINK_STEP >= min_size:
+            size -= SHRINK_STEP
+            lines = wrap_lines(text, font, size, max_width, keep_newlines)
+            if len(lines) <= max_lines:
+                return lines, size
+
+    lines = lines[:max_lines]
+    lines[-1] = truncate(lines[-1], font, size, max_width)
+    return lines, size
+
+# ----------------------------------------------------------------------
+# Formato de montos (las tarifas se repiten mucho entre filas y órdenes)
+# ----------------------------------------------------------------------
+
+@lru_cache(maxsize=4096)
+def format_amount(value, thousands: bool = True) -> str:
+    return f"${value:,.2f}" if thousands else f"${value:.2f}"
@@ -0,0 +1,103 @@
+import threading
+from collections import defaultdict
+
+from gspread.utils import numericise_all
+
+from utils.sheets_backend import cell_text
+
+# ----------------------------------------------------------------------
+# Índice en memoria de una hoja "por caso" (ventas / costos / ORDEN).
+#
+# Se construye con una sola lectura de la hoja y agrupa las filas por la
+# clave normalizada (no_solicitud). Consultar un caso es una búsqueda en
+# un dict; las escrituras que pasan por save_surcharges_orden y
+# save_order_submission actualizan el índice en sitio en lugar de volver
+# a descargar la hoja.
+# ----------------------------------------------------------------------
+
+
+def normalize_key(value) -> str:
+    return str(value).strip().upper()
+
+
+class SheetIndex:
+    def __init__(self, values: list, key_column: int = 0):
+        self.lock = threading.RLock()
+        self.key_column = key_column
+        self.headers = list(values[0]) if values else []
+        self._rows = [list(row) for row in values[1:]]
+        self._reindex()
+
+    def _key_of(self, row) -> str:
+        return normalize_key(row[self.key_column]) if len(row) > self.key_column else ""
+
+    def _reindex(self):
+        positions = defaultdict(list)
+        for pos, row in enumerate(self._rows):
+            positions[self._key_of(row)].append(pos)
+        self._positions = dict(positions)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return normalize_key(key) in self._positions
+
+    def row_numbers(self, key) -> list[int]:
+        # Fila 1 = encabezados, así que la posición 0 es la fila 2 de la hoja
+        return [pos + 2 for pos in self._positions.get(normalize_key(key), [])]
+
+    def row_number(self, key) -> int | None:
+        # Fila vigente del caso (la última si hay repetidas)
+        positions = self._positions.get(normalize_key(key))
+        return positions[-1] + 2 if positions else None
+
+    def records(self, key) -> list[dict]:
+        with self.lock:
+            rows = [self._rows[pos] for pos in self._positions.get(normalize_key(key), [])]
+
+        width = len(self.headers)
+        return [
+            dict(zip(self.headers, numericise_all(row[:width] + [""] * (width - len(row)))))
+            for row in rows
+        ]
+
+    def matches(self, key_column_values: list) -> bool:
+        # Compara la columna clave tal como la devuelve ws.col_values() con
+        # la copia en memoria; si difieren alguien editó la hoja por fuera.
+        ours = [row[self.key_column] if len(row) > self.key_column else "" for row in self._rows]
+        while ours and ours[-1] == "":
+            ours.pop()
+        return key_column_values[1:] == ours
+
+    def replace(self, key, rows: list):
+        # Refleja en memoria "borrar las filas del caso + append_rows(rows)"
+        with self.lock:
+            removed = set(self._positions.get(normalize_key(key), []))
+            if removed:
+                self._rows = [row for pos, row in enumerate(self._rows) if pos not in removed]
+                self._reindex()
+
+            for row in rows:
+                row = [cell_text(value) for value in row]
+                self._positions.setdefault(self._key_of(row), []).append(len(self._rows))
+                self._rows.append(row)
+
+    def set_row(self, sheet_row: int, row: list) -> bool:
+        # Refleja en memoria una fila escrita en `sheet_row`: reemplazo en
+        # sitio o append justo al final. False si no es ninguna de las dos
+        # (la hoja cambió por fuera y el índice hay que reconstruirlo).
+        row = [cell_text(value) for value in row]
+        with self.lock:
+            pos = sheet_row - 2
+            if 0 <= pos < len(self._rows):
+                changed = self._key_of(self._rows[pos]) != self._key_of(row)
+                self._rows[pos] = row
+                if changed:
+                    self._reindex()
+                return True
+            if pos == len(self._rows):
+                self._positions.setdefault(self._key_of(row), []).append(pos)
+                self._rows.append(row)
+                return True
+            return False
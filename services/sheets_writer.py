@@ -1,243 +1,281 @@
 import gspread
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 import streamlit as st
 from datetime import datetime
+import re
 import pytz
 from typing import List
 import streamlit as st
 import pandas as pd
-from utils.helpers import get_worksheet, load_clients_finance  
+from utils.client_catalog import ClientNames, normalize_name
+from utils.helpers import clients_finance_snapshot, clients_snapshot, get_worksheet, load_client_directory_finance, load_clients, open_spreadsheet, open_worksheet, cache_worksheet
+from services.sheet_index import SheetIndex, normalize_key
+from services import write_queue
+from services.surcharge_ledger import SurchargeLedger, order_totals
+from services.surcharges import ORDER_FIELDS, SurchargeTable
 
-# ============ AUTENTICACIÓN GCP ============
-
-credentials = Credentials.from_service_account_info(
-    st.secrets["google_sheets_credentials"],
-    scopes=[
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-)
-
-client_gcp = gspread.authorize(credentials)
-sheets_service = build("sheets", "v4", credentials=credentials)
 SPREADSHEET_ID = st.secrets["general"]["time_sheet_id"]
 ORDEN_ID = st.secrets["general"]["orden_sheet"]
 colombia_timezone = pytz.timezone('America/Bogota')
 
-def get_or_create_worksheet(sheet_name: str, headers: list = None):
+def now_timestamp() -> str:
+    return datetime.now(pytz.utc).astimezone(colombia_timezone).strftime('%Y-%m-%d %H:%M:%S')
+
+def _get_or_create(sheet_id: str, sheet_name: str, headers: list = None):
     try:
-        sheet = client_gcp.open_by_key(SPREADSHEET_ID)
         try:
-            worksheet = sheet.worksheet(sheet_name)
+            worksheet = open_worksheet(sheet_id, sheet_name)
         except gspread.exceptions.WorksheetNotFound:
-            worksheet = sheet.add_worksheet(title=sheet_name, rows="1000", cols="30")
+            worksheet = open_spreadsheet(sheet_id).add_worksheet(title=sheet_name, rows="1000", cols="30")
             if headers:
                 worksheet.append_row(headers)
+            cache_worksheet(sheet_id, worksheet)
             st.warning(f"Worksheet '{sheet_name}' was created.")
         return worksheet
     except gspread.exceptions.SpreadsheetNotFound:
         st.error("No se encontró la hoja de cálculo.")
         return None
 
+def get_or_create_worksheet(sheet_name: str, headers: list = None):
+    return _get_or_create(SPREADSHEET_ID, sheet_name, headers)
+
 def get_or_create_worksheet_orden(sheet_name: str, headers: list = None):
-    try:
-        sheet = client_gcp.open_by_key(ORDEN_ID)
-        try:
-            worksheet = sheet.worksheet(sheet_name)
-        except gspread.exceptions.WorksheetNotFound:
-            worksheet = sheet.add_worksheet(title=sheet_name, rows="1000", cols="30")
-            if headers:
-                worksheet.append_row(headers)
-            st.warning(f"Worksheet '{sheet_name}' was created.")
-        return worksheet
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error("No se encontró la hoja de cálculo.")
-        return None
+    return _get_or_create(ORDEN_ID, sheet_name, headers)
 
-def save_anticipo_submission(data: dict):
+def save_anticipo_submission(data: dict, submitted_at: str | None = None):
     SHEET_NAME = "SOLICITUD DE ANTICIPO"
     headers = [
         "Comercial", "Fecha", "Cliente", "Nombre Cliente", "Teléfono Cliente", "Email Cliente", "Contenedores", 
         "Tipo Servicio", "Tipo Operación", "Referencia", "Recargos", "Total USD", "Total COP", "TRM", "Total COP TRM"
     ]
 
+    # Se ejecuta desde la cola de escrituras (services.write_queue): los
+    # errores se propagan para que la tarea se reintente.
     worksheet = get_or_create_worksheet(SHEET_NAME, headers)
     if not worksheet:
-        return
-
-    try:
-        # Extraer campos
-        commercial = data["commercial"]
-        client = data["client"]
-        customer_name = data["customer_name"]
-        customer_phone = data["customer_phone"]
-        customer_email = data["customer_email"]
-        operation_type = data["operation_type"]
-        reference = data["reference"]
-        trm = data["trm"]
-        total_cop_trm = data["total_cop_trm"]
-
-        # Contenedores y servicios
-        containers = '\n'.join(
-            '\n'.join(x) if isinstance(x, list) else x
-            for x in data['container_type']
-        )
-        services = '\n'.join(
-            '\n'.join(x) if isinstance(x, list) else x
-            for x in data['transport_type']
-        )
-
-        # Recargos
-        usd_total = 0.0
-        cop_total = 0.0
-        surcharge_lines = []
-        for container_type, surcharges in data["additional_surcharges"].items():
-            for surcharge in surcharges:
-                cost = surcharge['cost']
-                currency = surcharge['currency']
-                concept = surcharge['concept']
-                surcharge_lines.append(f"{container_type} - {concept}: ${cost:.2f} {currency}")
-                if currency == "USD":
-                    usd_total += cost
-                elif currency == "COP":
-                    cop_total += cost
-
-        surcharge_str = '\n'.join(surcharge_lines)
-
-        # Timestamp
-        end_time = datetime.now(pytz.utc).astimezone(colombia_timezone)
-        timestamp = end_time.strftime('%Y-%m-%d %H:%M:%S')
-
-        # Escribir fila
-        row = [
-            commercial, timestamp, client, customer_name, customer_phone, customer_email, containers,
-            services, operation_type, reference, surcharge_str, usd_total, cop_total, trm, total_cop_trm
-        ]
-
-        worksheet.append_row(row, value_input_option="USER_ENTERED")
-        st.success("Datos de solicitud de anticipo guardados correctamente.")
-    except Exception as e:
-        st.error(f"Error guardando datos en hoja de anticipo: {e}")
-
-def register_new_client(client_name, clients_list):
-    from utils.helpers import load_clients
-    if not client_name: return
-
-    client_normalized = client_name.strip().lower()
-    normalized_existing = [c.strip().lower() for c in clients_list]
-
-    if client_normalized not in normalized_existing:
-        sheet = client_gcp.open_by_key(SPREADSHEET_ID)
-        worksheet = sheet.worksheet("clientes")
-        worksheet.append_row([client_name])
-        st.session_state["clients_list"].append(client_name)
-        st.session_state["client"] = None
-        load_clients.clear()
-        st.rerun()
-
-def save_order_submission(order_info: dict):
-
-    SHEET_NAME = "ORDEN"
-    headers = [
-        "Comercial", "Fecha", "No Solicitud", "Datos Cliente",
-        "BL/AWB", "Shipper", "Consignee", "Ruta (POL -> POD)", "Referencia",
-        "Tipo Carga", "Detalles de la Carga",
-        "Seguro",
-        "Recargos Venta", "Total Venta", "Recargos Costo", "Total Costo", "Profit",
-        "Comentarios Finales"
+        raise ValueError(f"No se pudo abrir la hoja '{SHEET_NAME}'.")
+
+    # Extraer campos
+    commercial = data["commercial"]
+    client = data["client"]
+    customer_name = data["customer_name"]
+    customer_phone = data["customer_phone"]
+    customer_email = data["customer_email"]
+    operation_type = data["operation_type"]
+    reference = data["reference"]
+    trm = data["trm"]
+    total_cop_trm = data["total_cop_trm"]
+
+    # Contenedores y servicios
+    containers = '\n'.join(
+        '\n'.join(x) if isinstance(x, list) else x
+        for x in data['container_type']
+    )
+    services = '\n'.join(
+        '\n'.join(x) if isinstance(x, list) else x
+        for x in data['transport_type']
+    )
+
+    # Recargos
+    surcharge_lines = []
+    for container_type, surcharges in data["additional_surcharges"].items():
+        for surcharge in surcharges:
+            cost = surcharge['cost']
+            currency = surcharge['currency']
+            concept = surcharge['concept']
+            surcharge_lines.append(f"{container_type} - {concept}: ${cost:.2f} {currency}")
+
+    surcharge_str = '\n'.join(surcharge_lines)
+    cost_totals = SurchargeLedger.for_anticipo(data["additional_surcharges"]).cost_totals()
+    usd_total = float(cost_totals.get("USD", 0))
+    cop_total = float(cost_totals.get("COP", 0))
+
+    # Timestamp (el del clic si la escritura llegó tarde por la cola)
+    timestamp = submitted_at or now_timestamp()
+
+    # Escribir fila
+    row = [
+        commercial, timestamp, client, customer_name, customer_phone, customer_email, containers,
+        services, operation_type, reference, surcharge_str, usd_total, cop_total, trm, total_cop_trm
     ]
 
-    worksheet = get_or_create_worksheet_orden(SHEET_NAME, headers)
-    if not worksheet:
+    worksheet.append_row(row, value_input_option="USER_ENTERED")
+
+def append_new_client(client_name):
+    # El nombre entra a la lista compartida (load_clients) sólo cuando ya
+    # está en la hoja: si la escritura falla, no queda un cliente fantasma
+    # que además impediría registrarlo de nuevo. Se recarga completa sólo
+    # si la fila no cayó donde se esperaba (alguien más escribió en la hoja).
+    worksheet = open_worksheet(SPREADSHEET_ID, "clientes")
+    response = worksheet.append_row([client_name])
+    clients = load_clients()
+    if clients.confirm_append(client_name, appended_row(response)):
+        clients_snapshot.save()
+    else:
+        clients.add(client_name)
+        clients_snapshot.invalidate()
+
+def register_new_client(client_name, clients: ClientNames):
+    if not client_name or not client_name.strip(): return
+    if client_name in clients: return
+
+    # Un envío repetido antes de que la escritura termine no la encola dos
+    # veces; si terminó en failed/ se puede volver a intentar
+    queued = st.session_state.setdefault("queued_clients", {})
+    key = normalize_name(client_name)
+    job_id = queued.get(key)
+    if job_id and write_queue.job_status(job_id)["state"] != "failed":
         return
 
-    try:
-        commercial = order_info["commercial"]
-        no_solicitud = order_info["no_solicitud"]
-
-        datos_cliente = (
-            f"Nombre: {order_info['client']}\n"
-            f"Teléfono: {order_info['customer_phone']}\n"
-            f"Dirección: {order_info['customer_address']}\n"
-            f"Cuenta: {order_info['customer_account']}\n"
-            f"NIT: {order_info['customer_nit']}\n"
-            f"Contacto: {order_info['customer_contact']}\n"
-            f"Email: {order_info['customer_email']}"
-        )
-
-        bl_awb = order_info["bl_awb"]
-        shipper = order_info["shipper"]
-        consignee = order_info["consignee"]
-        ruta = f"{order_info['pol_aol']} -> {order_info['pod_aod']}"
-        reference = order_info["reference"]
-
-        cargo_type = order_info["cargo_type"]
-        container_details = order_info["container_details"]
-        unidad_medida = order_info["unidad_medida"]
-        cantidad_suelta = order_info["cantidad_suelta"]
-
-        if container_details:
-            carga_lines = []
-            for c_type, details in container_details.items():
-                for name in details["names"]:
-                    carga_lines.append(f"{c_type}: {name}")
-            carga_str = '\n'.join(carga_lines)
+    queued[key] = write_queue.enqueue("append_new_client", client_name=client_name)
+    st.session_state.setdefault("write_jobs", []).append(queued[key])
+    # Se limpia en el próximo rerun, antes de crear el selectbox; aquí
+    # ya existe y un st.rerun() escondería el botón de descarga
+    st.session_state["client_new"] = None
+
+ORDEN_SHEET = "ORDEN"
+ORDEN_HEADERS = [
+    "Comercial", "Fecha", "No Solicitud", "Datos Cliente",
+    "BL/AWB", "Shipper", "Consignee", "Ruta (POL -> POD)", "Referencia",
+    "Tipo Carga", "Detalles de la Carga",
+    "Seguro",
+    "Recargos Venta", "Total Venta", "Recargos Costo", "Total Costo", "Profit",
+    "Comentarios Finales"
+]
+ORDEN_KEY_COLUMN = 3    # "No Solicitud"
+
+# ORDEN tiene una fila por orden: re-enviar una orden reescribe su fila en
+# lugar de agregar otra. El índice sólo guarda la columna No Solicitud (la
+# fila de cada orden); antes de reescribir se confirma leyendo esa celda,
+# por si la hoja se ordenó o se insertaron filas a mano.
+
+@st.cache_resource(ttl=900)
+def get_order_index() -> SheetIndex:
+    ws = get_or_create_worksheet_orden(ORDEN_SHEET, ORDEN_HEADERS)
+    if ws is None:
+        raise ValueError(f"No se pudo abrir la hoja '{ORDEN_SHEET}'.")
+    return SheetIndex([[key] for key in ws.col_values(ORDEN_KEY_COLUMN)])
+
+def _order_row(ws, no_solicitud):
+    # (índice, fila actual de la orden o None si es nueva)
+    index = get_order_index()
+    sheet_row = index.row_number(no_solicitud)
+    if sheet_row is None:
+        return index, None
+
+    cell = ws.get(gspread.utils.rowcol_to_a1(sheet_row, ORDEN_KEY_COLUMN))
+    current = cell[0][0] if cell and cell[0] else ""
+    if normalize_key(current) == normalize_key(no_solicitud):
+        return index, sheet_row
+
+    # La fila ya no es de esta orden: índice nuevo desde la hoja
+    get_order_index.clear()
+    index = get_order_index()
+    return index, index.row_number(no_solicitud)
+
+def save_order_submission(order_info: dict, submitted_at: str | None = None):
+
+    worksheet = get_or_create_worksheet_orden(ORDEN_SHEET, ORDEN_HEADERS)
+    if not worksheet:
+        raise ValueError(f"No se pudo abrir la hoja '{ORDEN_SHEET}'.")
+
+    commercial = order_info["commercial"]
+    no_solicitud = order_info["no_solicitud"]
+
+    datos_cliente = (
+        f"Nombre: {order_info['client']}\n"
+        f"Teléfono: {order_info['customer_phone']}\n"
+        f"Dirección: {order_info['customer_address']}\n"
+        f"Cuenta: {order_info['customer_account']}\n"
+        f"NIT: {order_info['customer_nit']}\n"
+        f"Contacto: {order_info['customer_contact']}\n"
+        f"Email: {order_info['customer_email']}"
+    )
+
+    bl_awb = order_info["bl_awb"]
+    shipper = order_info["shipper"]
+    consignee = order_info["consignee"]
+    ruta = f"{order_info['pol_aol']} -> {order_info['pod_aod']}"
+    reference = order_info["reference"]
+
+    cargo_type = order_info["cargo_type"]
+    container_details = order_info["container_details"]
+    unidad_medida = order_info["unidad_medida"]
+    cantidad_suelta = order_info["cantidad_suelta"]
+
+    if container_details:
+        carga_lines = []
+        for c_type, details in container_details.items():
+            for name in details["names"]:
+                carga_lines.append(f"{c_type}: {name}")
+        carga_str = '\n'.join(carga_lines)
+    else:
+        carga_str = f"{cantidad_suelta} {unidad_medida}"
+
+    insurance_required = order_info["insurance_required"]
+    valor_carga = order_info["valor_carga"]
+    porcentaje_seguro = order_info["porcentaje_seguro"]
+
+    if insurance_required:
+        valor_asegurado = float(valor_carga) * float(porcentaje_seguro) / 100
+        seguro_str = f"Sí\nValor carga: {valor_carga}\nPorcentaje seguro: {porcentaje_seguro}%\nValor asegurado: {valor_asegurado:.2f}"
+    else:
+        seguro_str = "No"
+
+    # Mismos totales que mostró el formulario (ver services.surcharge_ledger)
+    totals = order_totals(order_info)
+
+    sales_lines = []
+    for s in order_info["sales_surcharges"]:
+        total = s.get("total", 0.0)
+        currency = s.get("currency", "")
+        sales_lines.append(f"{s.get('concept', '')}: {s.get('quantity', 0)} × {s.get('rate', 0)} = {total:.2f} {currency}")
+    sales_surcharge_str = '\n'.join(sales_lines)
+    total_venta_str = '\n'.join(f"{currency}: {amount:.2f}" for currency, amount in totals["ventas"].items())
+
+    cost_lines = []
+    for s in order_info["cost_surcharges"]:
+        total = s.get("total", 0.0)
+        currency = s.get("currency", "")
+        cost_lines.append(f"{s.get('concept', '')}: {s.get('quantity', 0)} × {s.get('rate', 0)} = {total:.2f} {currency}")
+    cost_surcharge_str = '\n'.join(cost_lines)
+    total_costo_str = '\n'.join(f"{currency}: {amount:.2f}" for currency, amount in totals["costos"].items())
+    profit_str = '\n'.join(f"{currency}: {amount:.2f}" for currency, amount in totals["profit"].items())
+
+    timestamp = submitted_at or now_timestamp()
+
+    row = [
+        commercial, timestamp, no_solicitud, datos_cliente,
+        bl_awb, shipper, consignee, ruta, reference,
+        cargo_type, carga_str,
+        seguro_str,
+        sales_surcharge_str, total_venta_str,
+        cost_surcharge_str, total_costo_str,
+        profit_str,
+        order_info["final_comments"]
+    ]
+
+    if normalize_key(no_solicitud):
+        index, sheet_row = _order_row(worksheet, no_solicitud)
+    else:
+        # Sin No Solicitud no hay con qué reconocer la orden en un re-envío:
+        # siempre es una fila nueva (si no, la siguiente orden sin número
+        # reescribiría la de otro cliente)
+        index, sheet_row = get_order_index(), None
+    with index.lock:
+        if sheet_row is not None:
+            # Re-envío: la fila completa en una sola escritura
+            worksheet.update(
+                [row],
+                f"A{sheet_row}:{gspread.utils.rowcol_to_a1(sheet_row, len(row))}",
+                value_input_option="USER_ENTERED",
+            )
         else:
-            carga_str = f"{cantidad_suelta} {unidad_medida}"
+            response = worksheet.append_row(row, value_input_option="USER_ENTERED")
+            sheet_row = appended_row(response)
 
-        insurance_required = order_info["insurance_required"]
-        valor_carga = order_info["valor_carga"]
-        porcentaje_seguro = order_info["porcentaje_seguro"]
+        if sheet_row is None or not index.set_row(sheet_row, [no_solicitud]):
+            get_order_index.clear()
 
-        if insurance_required:
-            valor_asegurado = float(valor_carga) * float(porcentaje_seguro) / 100
-            seguro_str = f"Sí\nValor carga: {valor_carga}\nPorcentaje seguro: {porcentaje_seguro}%\nValor asegurado: {valor_asegurado:.2f}"
-        else:
-            seguro_str = "No"
-
-        sales_totals = {}
-        sales_lines = []
-        for s in order_info["sales_surcharges"]:
-            total = s.get("total", 0.0)
-            currency = s.get("currency", "")
-            sales_lines.append(f"{s.get('concept', '')}: {s.get('quantity', 0)} × {s.get('rate', 0)} = {total:.2f} {currency}")
-            sales_totals[currency] = sales_totals.get(currency, 0.0) + total
-        sales_surcharge_str = '\n'.join(sales_lines)
-        total_venta_str = '\n'.join(f"{currency}: {amount:.2f}" for currency, amount in sales_totals.items())
-
-        cost_totals = {}
-        cost_lines = []
-        for s in order_info["cost_surcharges"]:
-            total = s.get("total", 0.0)
-            currency = s.get("currency", "")
-            cost_lines.append(f"{s.get('concept', '')}: {s.get('quantity', 0)} × {s.get('rate', 0)} = {total:.2f} {currency}")
-            cost_totals[currency] = cost_totals.get(currency, 0.0) + total
-        cost_surcharge_str = '\n'.join(cost_lines)
-        total_costo_str = '\n'.join(f"{currency}: {amount:.2f}" for currency, amount in cost_totals.items())
-
-        profit_str = '\n'.join(
-            f"{currency}: {sales_totals.get(currency, 0.0) - cost_totals.get(currency, 0.0):.2f}"
-            for currency in set(sales_totals) | set(cost_totals)
-        )
-
-        timestamp = datetime.now(pytz.utc).astimezone(colombia_timezone).strftime('%Y-%m-%d %H:%M:%S')
-
-        row = [
-            commercial, timestamp, no_solicitud, datos_cliente,
-            bl_awb, shipper, consignee, ruta, reference,
-            cargo_type, carga_str,
-            seguro_str,
-            sales_surcharge_str, total_venta_str,
-            cost_surcharge_str, total_costo_str,
-            profit_str,
-            order_info["final_comments"]
-        ]
-
-        worksheet.append_row(row, value_input_option="USER_ENTERED")
-
-    except Exception as e:
-        st.error(f"Error guardando datos en hoja ORDEN: {e}")
 
 
 def save_new_client_finance(new_row: List[str]) -> None:
@@ -247,39 +285,114 @@ def save_new_client_finance(new_row: List[str]) -> None:
     if ws is None:              
         st.error("❌ No se pudo acceder a la hoja para guardar el cliente.")
         return
-    ws.append_row(new_row)
+    response = ws.append_row(new_row)
+
+    # Se aplica la fila al DataFrame en caché; recarga completa sólo si la
+    # hoja cambió por fuera
+    if load_client_directory_finance().append(new_row, appended_row(response)):
+        clients_finance_snapshot.save()
+    else:
+        clients_finance_snapshot.invalidate()
 
-    load_clients_finance.clear() 
+def appended_row(response) -> int | None:
+    # Fila donde quedó un append_row, según updatedRange ("'hoja'!A12:H12")
+    try:
+        updated = response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    match = re.search(r"![A-Z]+(\d+)", updated)
+    return int(match.group(1)) if match else None
+
+def merge_row_ranges(rows):
+    # Agrupa números de fila en rangos contiguos [(inicio, fin), ...] ordenados
+    ranges = []
+    for row in sorted(set(rows)):
+        if ranges and row == ranges[-1][1] + 1:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+    return [(start, end) for start, end in ranges]
+
+def delete_rows_batch(ws, rows):
+    # Un único batchUpdate con un deleteDimension por rango contiguo. Los
+    # rangos van de abajo hacia arriba para que los índices no se muevan
+    # entre una eliminación y la siguiente.
+    ranges = merge_row_ranges(rows)
+    if not ranges:
+        return
 
-def clean_sheet_of_solicitud(ws, no_solicitud):
-    no_solicitud_clean = no_solicitud.strip().upper()
-    all_values = ws.get_all_values()
+    requests = [
+        {
+            "deleteDimension": {
+                "range": {
+                    "sheetId": ws.id,
+                    "dimension": "ROWS",
+                    "startIndex": start - 1,
+                    "endIndex": end,
+                }
+            }
+        }
+        for start, end in reversed(ranges)
+    ]
+    ws.spreadsheet.batch_update({"requests": requests})
 
-    if not all_values:
+def clean_sheet_of_solicitud(ws, no_solicitud, keys=None):
+    no_solicitud_clean = normalize_key(no_solicitud)
+    # Una clave vacía coincidiría con las filas sin no_solicitud, y cuáles
+    # son depende de cuánto recorte col_values al final de la columna
+    if not no_solicitud_clean:
         return
 
-    headers = all_values[0]
-    rows = all_values[1:]
+    # Sólo hace falta la columna A (no_solicitud) para ubicar las filas
+    if keys is None:
+        keys = ws.col_values(1)
+    if not keys:
+        return
 
     # Buscar los índices de las filas a borrar (empezando desde fila 2)
-    to_delete = []
-    for i, row in enumerate(rows, start=2):  # Fila 2 = primer dato
-        current = row[0].strip().upper() if len(row) > 0 else ""
-        if current == no_solicitud_clean:
-            to_delete.append(i)
+    to_delete = [
+        i for i, current in enumerate(keys[1:], start=2)  # Fila 2 = primer dato
+        if normalize_key(current) == no_solicitud_clean
+    ]
 
-    # Eliminar desde el final hacia el principio para que los índices no se muevan
-    for i in reversed(to_delete):
-        ws.delete_rows(i)
+    delete_rows_batch(ws, to_delete)
 
 
+SURCHARGE_HEADERS = ["no_solicitud", "tipo", "concept", "quantity", "rate", "total", "currency"]
+
+@st.cache_resource(ttl=900)
+def get_surcharge_index(sheet_name: str) -> SheetIndex:
+    ws = get_or_create_worksheet_orden(sheet_name, SURCHARGE_HEADERS)
+    if ws is None:
+        raise ValueError(f"No se pudo abrir la hoja '{sheet_name}'.")
+    return SheetIndex(ws.get_all_values())
+
+def _replace_case_rows(ws, index: SheetIndex, no_solicitud, rows):
+    with index.lock:
+        keys = ws.col_values(1)
+        in_sync = index.matches(keys)
+
+        clean_sheet_of_solicitud(ws, no_solicitud, keys)
+        # Una sola llamada por hoja, sin importar cuántas líneas tenga la orden
+        if rows:
+            ws.append_rows(rows)
+
+        if in_sync:
+            index.replace(no_solicitud, rows)
+        else:
+            # La hoja cambió por fuera: el índice se reconstruye en la próxima lectura
+            get_surcharge_index.clear()
 
 def save_surcharges_orden(no_solicitud, sales, costs):
-    ventas_ws = get_or_create_worksheet_orden("ventas", ["no_solicitud", "tipo", "concept", "quantity", "rate", "total", "currency"])
-    costos_ws = get_or_create_worksheet_orden("costos", ["no_solicitud", "tipo", "concept", "quantity", "rate", "total", "currency"])
+    # Sin caso no hay filas que reemplazar ni con qué leerlas después;
+    # ValueError la aparta en failed/ sin reintentos
+    if not normalize_key(no_solicitud):
+        raise ValueError("No se pueden guardar recargos sin no_solicitud.")
 
-    clean_sheet_of_solicitud(ventas_ws, no_solicitud)
-    clean_sheet_of_solicitud(costos_ws, no_solicitud)
+    ventas_ws = get_or_create_worksheet_orden("ventas", SURCHARGE_HEADERS)
+    costos_ws = get_or_create_worksheet_orden("costos", SURCHARGE_HEADERS)
+    if not ventas_ws or not costos_ws:
+        raise ValueError("No se pudieron abrir las hojas de recargos.")
 
     sales_rows = [
         [no_solicitud, "venta", s["concept"], s["quantity"], s["rate"], s["total"], s["currency"]]
@@ -290,37 +403,20 @@ def save_surcharges_orden(no_solicitud, sales, costs):
         for c in costs
     ]
 
-    for row in sales_rows:
-        ventas_ws.append_row(row)
-    for row in cost_rows:
-        costos_ws.append_row(row)
+    _replace_case_rows(ventas_ws, get_surcharge_index("ventas"), no_solicitud, sales_rows)
+    _replace_case_rows(costos_ws, get_surcharge_index("costos"), no_solicitud, cost_rows)
 
 def load_surcharges_by_case_orden(no_solicitud):
-    ventas_ws = get_or_create_worksheet_orden("ventas")
-    costos_ws = get_or_create_worksheet_orden("costos")
-
-    ventas_data = ventas_ws.get_all_records()
-    costos_data = costos_ws.get_all_records()
+    ventas_index = get_surcharge_index("ventas")
+    costos_index = get_surcharge_index("costos")
 
-    if not ventas_data and not costos_data:
-        return [], []
+    if not len(ventas_index) and not len(costos_index):
+        return SurchargeTable(ORDER_FIELDS), SurchargeTable(ORDER_FIELDS)
 
-    ventas_df = pd.DataFrame(ventas_data)
-    costos_df = pd.DataFrame(costos_data)
-
-    if "no_solicitud" not in ventas_df.columns or "no_solicitud" not in costos_df.columns:
+    if "no_solicitud" not in ventas_index.headers or "no_solicitud" not in costos_index.headers:
         raise ValueError("Las hojas no contienen la columna 'no_solicitud'.")
 
-    no_solicitud_clean = no_solicitud.strip().upper()
-
-    ventas_df["no_solicitud"] = ventas_df["no_solicitud"].astype(str).str.strip().str.upper()
-    costos_df["no_solicitud"] = costos_df["no_solicitud"].astype(str).str.strip().str.upper()
-
-    ventas_match = ventas_df[ventas_df["no_solicitud"] == no_solicitud_clean]
-    costos_match = costos_df[costos_df["no_solicitud"] == no_solicitud_clean]
-
-    ventas_list = ventas_match[["concept", "quantity", "rate", "total", "currency"]].to_dict(orient="records")
-    costos_list = costos_match[["concept", "quantity", "rate", "total", "currency"]].to_dict(orient="records")
-
-    return ventas_list, costos_list
+    ventas = SurchargeTable(ORDER_FIELDS, ventas_index.records(no_solicitud))
+    costos = SurchargeTable(ORDER_FIELDS, costos_index.records(no_solicitud))
 
+    return ventas, costos
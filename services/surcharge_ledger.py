@@ -0,0 +1,149 @@
+from decimal import Decimal, ROUND_CEILING, ROUND_HALF_UP
+
+import numpy as np
+
+# ----------------------------------------------------------------------
+# Totales por moneda de los recargos.
+#
+# Un solo motor para el formulario, las hojas y los PDFs: al entrar, cada
+# monto se pasa por Decimal a millonésimas enteras y se guarda en arreglos
+# de NumPy junto con el lado (venta/costo) y el código de moneda. Cada
+# línea se redondea al centavo (ROUND_HALF_UP, con aritmética entera) y se
+# suma por moneda con np.add.at, sin errores de float; al salir los
+# centavos vuelven a Decimal con dos decimales.
+#
+# El recargo del 4% sobre costos (COST_MARKUP) se aplica por línea antes
+# de ese redondeo, igual que se imprime en el PDF.
+# ----------------------------------------------------------------------
+
+COST_MARKUP = Decimal("1.04")
+CENT = Decimal("0.01")
+UNITS = 10 ** 6         # millonésimas por unidad de moneda
+
+SALE = 0
+COST = 1
+
+
+def to_units(value) -> int:
+    # str() para que 2.675 sea 2.675 y no 2.67499999...
+    return int(Decimal(str(value or 0)).scaleb(6).quantize(Decimal(1), ROUND_HALF_UP))
+
+
+def from_cents(cents) -> Decimal:
+    return (Decimal(int(cents)) / 100).quantize(CENT)
+
+
+def format_es(value) -> str:
+    # $1.234,56 (separadores latinos, como en los PDFs)
+    return f"${value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+class SurchargeLedger:
+    __slots__ = ("currencies", "_side", "_code", "_units")
+
+    def __init__(self, lines=()):
+        # lines: (lado, moneda, monto)
+        currencies = {}
+        sides, codes, units = [], [], []
+        for side, currency, amount in lines:
+            currency = (currency or "").upper()
+            sides.append(side)
+            codes.append(currencies.setdefault(currency, len(currencies)))
+            units.append(to_units(amount))
+        self.currencies = tuple(currencies)     # en orden de aparición
+        self._side = np.array(sides, dtype=np.int8)
+        self._code = np.array(codes, dtype=np.int16)
+        self._units = np.array(units, dtype=np.int64)
+
+    @classmethod
+    def for_order(cls, sales, costs) -> "SurchargeLedger":
+        # Pre-orden: líneas de venta y de costo con "total" y "currency"
+        return cls([
+            *((SALE, s.get("currency", ""), s.get("total", 0)) for s in sales),
+            *((COST, c.get("currency", ""), c.get("total", 0)) for c in costs),
+        ])
+
+    @classmethod
+    def for_anticipo(cls, additional_surcharges: dict) -> "SurchargeLedger":
+        # Anticipo: {contenedor: [{"cost", "currency"}, ...]}, todo es costo
+        return cls(
+            (COST, s.get("currency", ""), s.get("cost", 0))
+            for surcharges in additional_surcharges.values()
+            for s in surcharges
+        )
+
+    def __len__(self):
+        return len(self._units)
+
+    def _totals(self, side, markup=None) -> dict:
+        mask = self._side == side
+        codes = self._code[mask]
+        units = self._units[mask]
+        num, den = Decimal(markup).as_integer_ratio() if markup is not None else (1, 1)
+        # Centavos por línea: units * markup / 10^4, half-up exacto con enteros
+        den *= UNITS // 100
+        cents = np.sign(units) * ((2 * np.abs(units) * num + den) // (2 * den))
+
+        sums = np.zeros(len(self.currencies), dtype=np.int64)
+        np.add.at(sums, codes, cents)
+        # Monedas de este lado, en el orden en que aparecen sus líneas
+        present, first = np.unique(codes, return_index=True)
+        order = present[np.argsort(first)]
+        return {self.currencies[i]: from_cents(sums[i]) for i in order}
+
+    def sales_totals(self) -> dict:
+        return self._totals(SALE)
+
+    def cost_totals(self, markup=None) -> dict:
+        return self._totals(COST, markup)
+
+    def profit(self) -> dict:
+        sales, costs = self.sales_totals(), self.cost_totals()
+        return {
+            currency: sales.get(currency, Decimal("0.00")) - costs.get(currency, Decimal("0.00"))
+            for currency in self.currencies
+            if currency in sales or currency in costs
+        }
+
+    def summary(self) -> dict:
+        # Lo que necesitan el formulario, la hoja ORDEN y los PDFs de la
+        # pre-orden, calculado una sola vez
+        return {
+            "ventas": self.sales_totals(),
+            "costos": self.cost_totals(),
+            "costos_markup": self.cost_totals(COST_MARKUP),
+            "profit": self.profit(),
+        }
+
+    def converted_total(self, trm=None) -> tuple[Decimal, str]:
+        # Total del anticipo y su moneda. Con TRM los USD pasan a COP; el
+        # resultado se redondea hacia arriba al centavo.
+        mask = self._side == COST
+        codes = self._code[mask]
+        currencies = {self.currencies[i] for i in np.unique(codes)} - {""}
+        label = "COP" if currencies == {"COP"} else "USD" if currencies == {"USD"} else "COP"
+
+        # Sobre los montos sin redondear, como si se sumara línea a línea
+        sums = np.zeros(len(self.currencies), dtype=np.int64)
+        np.add.at(sums, codes, self._units[mask])
+        total = Decimal(int(sums.sum()))
+        if trm is not None and "USD" in self.currencies:
+            usd = Decimal(int(sums[self.currencies.index("USD")]))
+            total += usd * Decimal(str(trm)) - usd
+        return (total / UNITS).quantize(CENT, ROUND_CEILING), label
+
+
+def serialize_totals(summary: dict) -> dict:
+    # Para guardar en el payload de la orden (JSON): Decimal -> str
+    return {name: {c: str(v) for c, v in totals.items()} for name, totals in summary.items()}
+
+
+def order_totals(order_info: dict) -> dict:
+    # Totales de la pre-orden: los que calculó el formulario si vienen en
+    # el payload, si no se calculan aquí
+    totals = order_info.get("totals")
+    if totals:
+        return {name: {c: Decimal(v) for c, v in t.items()} for name, t in totals.items()}
+    return SurchargeLedger.for_order(
+        order_info.get("sales_surcharges", []), order_info.get("cost_surcharges", [])
+    ).summary()
@@ -0,0 +1,234 @@
+import itertools
+import sys
+from array import array
+
+# ----------------------------------------------------------------------
+# Recargos compactos para st.session_state.
+#
+# Cada línea era un dict con sus propios float: unos 400 bytes por línea,
+# por sesión. SurchargeTable guarda las columnas numéricas en array("d")
+# (8 bytes por valor), la moneda como un código de 1 byte contra una lista
+# corta de monedas internadas y los conceptos (también internados: se
+# repiten entre líneas y entre sesiones) en una lista.
+#
+# Iterar o indexar la tabla devuelve Surcharge, una vista de la fila que
+# se lee y se escribe como el dict de antes (s["total"], s.get(...)), así
+# los formularios, sheets_writer, el ledger y los PDFs aceptan igual una
+# tabla o una lista de dicts (lo que llega de la cola de escrituras).
+#
+# Los números conservan su tipo: un int (p. ej. leído de la hoja) vuelve
+# como int, para que number_input y el PDF los muestren igual que antes.
+#
+# Cada fila tiene un id estable (para las claves de los widgets: borrar
+# una fila no corre las de abajo) y la tabla un `version` que sólo cambia
+# si cambia algún valor, para no recalcular totales en cada rerun.
+# ----------------------------------------------------------------------
+
+ORDER_FIELDS = ("quantity", "rate", "total")    # ventas/costos de la pre-orden
+ANTICIPO_FIELDS = ("cost",)                      # recargos del anticipo
+
+_versions = itertools.count(1)  # compartido: dos tablas nunca tienen la misma versión
+
+
+def _number(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _text(value) -> str:
+    return sys.intern("" if value is None else str(value))
+
+
+class Surcharge:
+    # Vista de una fila; no copia nada
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, field):
+        return self._table.value(self._row, field)
+
+    def __setitem__(self, field, value):
+        self._table.set_value(self._row, field, value)
+
+    @property
+    def id(self) -> int:
+        return self._table._ids[self._row]
+
+    def get(self, field, default=None):
+        try:
+            return self._table.value(self._row, field)
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self._table.keys()
+
+    def to_dict(self) -> dict:
+        return {field: self[field] for field in self._table.keys()}
+
+    def __repr__(self):
+        return f"Surcharge({self.to_dict()!r})"
+
+
+class SurchargeTable:
+    __slots__ = ("fields", "version", "_concepts", "_currencies", "_codes", "_columns", "_ints", "_ids", "_next_id")
+
+    def __init__(self, fields=ORDER_FIELDS, records=()):
+        self.fields = tuple(fields)
+        self._concepts = []
+        self._currencies = []       # código -> moneda
+        self._codes = array("B")
+        self._columns = [array("d") for _ in self.fields]
+        self._ints = array("B")     # bit i: el campo i era int
+        self._ids = array("L")
+        self._next_id = 0
+        self.version = next(_versions)
+        for record in records:
+            self.append(record)
+
+    @classmethod
+    def coerce(cls, value, fields=ORDER_FIELDS) -> "SurchargeTable":
+        # Lo que haya en session_state (tabla, lista de dicts o basura)
+        if isinstance(value, SurchargeTable):
+            return value
+        if isinstance(value, (list, tuple)):
+            return cls(fields, value)
+        return cls(fields)
+
+    def keys(self):
+        return ("concept", *self.fields, "currency")
+
+    # ------------------------------ filas -------------------------------
+
+    def _currency_code(self, currency) -> int:
+        currency = _text(currency)
+        try:
+            return self._currencies.index(currency)
+        except ValueError:
+            self._currencies.append(currency)
+            return len(self._currencies) - 1
+
+    def append(self, record=None, **values):
+        record = {**(record or {}), **values}
+        ints = 0
+        for i, (field, column) in enumerate(zip(self.fields, self._columns)):
+            value = record.get(field, 0.0)
+            if isinstance(value, int) and not isinstance(value, bool):
+                ints |= 1 << i
+            column.append(_number(value))
+        self._concepts.append(_text(record.get("concept", "")))
+        self._codes.append(self._currency_code(record.get("currency", "")))
+        self._ints.append(ints)
+        self._ids.append(self._next_id)
+        self._next_id += 1
+        self.version = next(_versions)
+
+    def pop(self, index=-1) -> dict:
+        row = self[index].to_dict()
+        index = self._position(index)
+        del self._concepts[index]
+        del self._codes[index]
+        del self._ints[index]
+        del self._ids[index]
+        for column in self._columns:
+            del column[index]
+        self.version = next(_versions)
+        return row
+
+    def remove(self, row_id):
+        # Por id estable (callback del botón ❌); si ya no está, nada
+        try:
+            index = self._ids.index(row_id)
+        except ValueError:
+            return
+        self.pop(index)
+
+    def __delitem__(self, index):
+        self.pop(index)
+
+    def _position(self, index) -> int:
+        size = len(self._concepts)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("índice de recargo fuera de rango")
+        return index
+
+    def __len__(self):
+        return len(self._concepts)
+
+    def __getitem__(self, index) -> Surcharge:
+        return Surcharge(self, self._position(index))
+
+    def __iter__(self):
+        for row in range(len(self._concepts)):
+            yield Surcharge(self, row)
+
+    # ----------------------------- celdas -------------------------------
+
+    def value(self, row, field):
+        if field == "concept":
+            return self._concepts[row]
+        if field == "currency":
+            return self._currencies[self._codes[row]]
+        try:
+            i = self.fields.index(field)
+        except ValueError:
+            raise KeyError(field) from None
+        value = self._columns[i][row]
+        return int(value) if self._ints[row] >> i & 1 else value
+
+    def set_value(self, row, field, value):
+        # Los formularios reescriben cada celda en cada rerun: sólo se
+        # cambia la versión si el valor es otro
+        if field == "concept":
+            value = _text(value)
+            if value == self._concepts[row]:
+                return
+            self._concepts[row] = value
+        elif field == "currency":
+            code = self._currency_code(value)
+            if code == self._codes[row]:
+                return
+            self._codes[row] = code
+        else:
+            try:
+                i = self.fields.index(field)
+            except ValueError:
+                raise KeyError(field) from None
+            number = _number(value)
+            flags = self._ints[row]
+            if isinstance(value, int) and not isinstance(value, bool):
+                flags |= 1 << i
+            else:
+                flags &= ~(1 << i) & 0xFF
+            if number == self._columns[i][row] and flags == self._ints[row]:
+                return
+            self._columns[i][row] = number
+            self._ints[row] = flags
+        self.version = next(_versions)
+
+    def column(self, field) -> array:
+        # Columna numérica sin copiar (siempre float)
+        return self._columns[self.fields.index(field)]
+
+    def to_records(self) -> list[dict]:
+        return [row.to_dict() for row in self]
+
+    def __repr__(self):
+        return f"SurchargeTable({len(self)} recargos)"
+
+
+def as_json(value):
+    # default= de json.dump: las tablas se guardan como la lista de dicts
+    # de siempre (las claves de caché y la cola de escrituras no cambian)
+    if isinstance(value, SurchargeTable):
+        return value.to_records()
+    if isinstance(value, Surcharge):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,287 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import gspread
+import streamlit as st
+
+from services.surcharges import as_json
+
+# ----------------------------------------------------------------------
+# Cola de escrituras a Google Sheets en segundo plano.
+#
+# Cada escritura se guarda primero como un JSON en SPOOL_DIR y después la
+# procesa un único hilo trabajador, en orden de llegada dentro de cada
+# caso (no_solicitud; las tareas sin caso, por tipo). Si Sheets falla la
+# tarea se reintenta con backoff exponencial; el archivo sólo se borra
+# cuando la escritura termina, así que una caída de Google (o un reinicio
+# del servidor) retrasa la persistencia pero no la pierde. Mientras una
+# tarea espera su backoff, las de otros casos siguen pasando. Los errores
+# definitivos (4xx distintos de 429) y las tareas que agotan MAX_ATTEMPTS
+# se apartan en SPOOL_DIR/failed.
+# ----------------------------------------------------------------------
+
+SPOOL_DIR = "resources/spool"
+FAILED_DIR = os.path.join(SPOOL_DIR, "failed")
+
+BACKOFF_BASE = 2.0      # segundos
+BACKOFF_MAX = 300.0
+POLL_INTERVAL = 5.0
+# Con el backoff de arriba, unos 40 minutos de reintentos
+MAX_ATTEMPTS = int(os.environ.get("SHEETS_WRITE_MAX_ATTEMPTS", 15))
+MAX_STATUSES = 1000
+
+# Funciones de services.sheets_writer que se pueden encolar
+JOB_KINDS = {
+    "save_order_submission",
+    "save_surcharges_orden",
+    "save_anticipo_submission",
+    "append_new_client",
+}
+
+_wake = threading.Event()
+_worker_lock = threading.Lock()
+_worker = None
+
+_status_lock = threading.Lock()
+_statuses = OrderedDict()   # job id -> {"state", "kind", "attempts", "last_error"}
+
+
+# ---------------------------- spool en disco ----------------------------
+
+def _job_path(job) -> str:
+    return os.path.join(SPOOL_DIR, f"{job['created_ns']:020d}-{job['id']}.json")
+
+
+def _write_job(job, path=None) -> str:
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    path = path or _job_path(job)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False, default=as_json)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def _pending_paths() -> list[str]:
+    try:
+        names = os.listdir(SPOOL_DIR)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(SPOOL_DIR, n) for n in sorted(names) if n.endswith(".json")]
+
+
+# ------------------------------- estados --------------------------------
+
+def _set_status(job, state):
+    with _status_lock:
+        _statuses[job["id"]] = {
+            "state": state,
+            "kind": job["kind"],
+            "attempts": job["attempts"],
+            "last_error": job.get("last_error"),
+        }
+        _statuses.move_to_end(job["id"])
+        while len(_statuses) > MAX_STATUSES:
+            _statuses.popitem(last=False)
+
+
+def job_status(job_id: str) -> dict:
+    with _status_lock:
+        status = _statuses.get(job_id)
+    if status is not None:
+        return dict(status)
+    # Tras un reinicio sólo queda lo que hay en disco
+    for path in _pending_paths():
+        if job_id in os.path.basename(path):
+            return {"state": "pending", "kind": None, "attempts": 0, "last_error": None}
+    return {"state": "unknown", "kind": None, "attempts": 0, "last_error": None}
+
+
+def pending_count() -> int:
+    return len(_pending_paths())
+
+
+# ------------------------------- trabajador -----------------------------
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, (TypeError, KeyError, ValueError)):
+        return True
+    if isinstance(error, gspread.exceptions.APIError):
+        code = getattr(error, "code", None) or 0
+        return 400 <= code < 500 and code != 429
+    return False
+
+
+def _run(job):
+    from services import sheets_writer
+
+    getattr(sheets_writer, job["kind"])(**job["payload"])
+
+
+def _read_job(path) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _order_key(job) -> str:
+    # Tareas con la misma clave se escriben en orden de llegada (p. ej.
+    # recargos de un mismo caso guardados dos veces)
+    payload = job.get("payload", {})
+    case = payload.get("no_solicitud")
+    if case is None:
+        case = (payload.get("order_info") or {}).get("no_solicitud")
+    case = str(case or "").strip().upper()
+    return f"caso:{case}" if case else f"tipo:{job.get('kind')}"
+
+
+def _process(path, job):
+    _set_status(job, "running")
+    try:
+        _run(job)
+    except Exception as e:
+        job["attempts"] += 1
+        job["last_error"] = f"{type(e).__name__}: {e}"
+
+        if _is_permanent(e) or job["attempts"] >= MAX_ATTEMPTS:
+            os.makedirs(FAILED_DIR, exist_ok=True)
+            _write_job(job, os.path.join(FAILED_DIR, os.path.basename(path)))
+            os.remove(path)
+            _set_status(job, "failed")
+            return
+
+        backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (job["attempts"] - 1))
+        job["next_attempt"] = time.time() + backoff * random.uniform(0.8, 1.2)
+        _write_job(job, path)
+        _set_status(job, "retrying")
+        return
+
+    os.remove(path)
+    _set_status(job, "done")
+
+
+def _next_job(paths):
+    # (ruta, tarea, 0) de la primera tarea lista cuya clave no tenga otra
+    # anterior pendiente, o (None, None, segundos hasta la próxima lista)
+    blocked = set()
+    delay = POLL_INTERVAL
+    for path in paths:
+        try:
+            job = _read_job(path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ No se pudo leer la tarea {os.path.basename(path)}: {e}")
+            continue
+
+        key = _order_key(job)
+        if key in blocked:
+            continue
+        blocked.add(key)
+
+        wait = job.get("next_attempt", 0) - time.time()
+        if wait <= 0:
+            return path, job, 0
+        delay = min(delay, wait)
+    return None, None, delay
+
+
+def _loop():
+    while True:
+        paths = _pending_paths()
+        if not paths:
+            _wake.wait(POLL_INTERVAL)
+            _wake.clear()
+            continue
+
+        path, job, delay = _next_job(paths)
+        if path is None:
+            _wake.wait(delay)
+            _wake.clear()
+            continue
+
+        try:
+            _process(path, job)
+        except Exception as e:
+            print(f"⚠️ Error en la cola de escrituras: {e}")
+            _wake.wait(POLL_INTERVAL)
+            _wake.clear()
+
+
+def start_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_loop, name="sheets-write-queue", daemon=True)
+            _worker.start()
+
+
+def enqueue(kind: str, **payload) -> str:
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Tipo de escritura desconocido: {kind}")
+
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "payload": payload,
+        "attempts": 0,
+        "created_ns": time.time_ns(),
+        "next_attempt": 0,
+        "last_error": None,
+    }
+    _write_job(job)
+    _set_status(job, "pending")
+
+    start_worker()
+    _wake.set()
+    return job["id"]
+
+
+# ------------------------------ interfaz --------------------------------
+
+FINAL_STATES = {"done", "failed", "unknown"}   # "unknown": ni en memoria ni en disco
+
+
+def _show_status(statuses: list[dict]):
+    states = [s["state"] for s in statuses]
+
+    if all(state in ("done", "unknown") for state in states):
+        st.success("✅ Datos guardados en Google Sheets.")
+    elif "failed" in states:
+        errors = [s["last_error"] for s in statuses if s["state"] == "failed"]
+        st.error(f"❌ No se pudieron guardar algunos datos: {errors[0]}")
+    elif "retrying" in states:
+        errors = [s["last_error"] for s in statuses if s["state"] == "retrying"]
+        st.warning(f"⏳ Google Sheets no responde, reintentando… ({errors[0]})")
+    else:
+        pending = sum(state != "done" for state in states)
+        st.info(f"⏳ Guardando en Google Sheets ({pending} pendiente(s))…")
+
+
+@st.fragment(run_every=2)
+def _poll_status(job_ids: list[str]):
+    statuses = [job_status(job_id) for job_id in job_ids]
+    if all(s["state"] in FINAL_STATES for s in statuses):
+        # Rerun completo: render_status ya no crea este fragmento y el
+        # sondeo cada 2 s se detiene
+        st.rerun()
+    _show_status(statuses)
+
+
+def render_status(job_ids: list[str]):
+    # Sólo se sondea mientras alguna escritura sigue en curso; sin tareas
+    # o con todas terminadas el mensaje es estático
+    if not job_ids:
+        return
+
+    statuses = [job_status(job_id) for job_id in job_ids]
+    if all(s["state"] in FINAL_STATES for s in statuses):
+        _show_status(statuses)
+    else:
+        _poll_status(job_ids)
@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+
+# ----------------------------------------------------------------------
+# Catálogos de referencia (listas de clientes) con copia en disco.
+#
+# Stale-while-revalidate: get() devuelve enseguida lo que haya en memoria
+# o, tras un reinicio, el último snapshot de SNAPSHOT_DIR; si esa copia
+# viene del disco o tiene más de REVALIDATE_AFTER segundos, se revalida en
+# un hilo aparte. Revalidar cuesta una llamada (modifiedTime de la hoja en
+# Drive) y sólo si cambió se descarga la hoja completa y se reescribe el
+# snapshot. Sólo el primer arranque sin snapshot espera la descarga.
+# ----------------------------------------------------------------------
+
+SNAPSHOT_DIR = "resources/cache/catalogs"
+REVALIDATE_AFTER = 600      # segundos
+
+
+class CatalogSnapshot:
+    def __init__(self, name: str, sheet_id, modified_time, fetch, build, dump):
+        # sheet_id() -> id de la hoja (se lee de secrets al usarlo)
+        # modified_time(sheet_id) -> modifiedTime de la hoja
+        # fetch(sheet_id) -> datos JSON de la hoja (lanza si no se pudo leer)
+        # build(datos) -> catálogo en memoria (ClientNames, ClientDirectory)
+        # dump(catálogo) -> datos JSON, para guardar los cambios en sitio
+        self.name = name
+        self._sheet_id = sheet_id
+        self._modified_time = modified_time
+        self._fetch = fetch
+        self._build = build
+        self._dump = dump
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._value = None
+        self._modified = None   # modifiedTime de la hoja cuando se descargó
+        self._checked = 0.0     # time.time() de la última revalidación
+        self._refreshing = False
+        self._thread = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(SNAPSHOT_DIR, f"{self.name}.json")
+
+    # ------------------------------ disco -------------------------------
+
+    def _read_snapshot(self, sheet_id):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Snapshot ilegible de {self.name}: {e}")
+            return None
+        # Otra hoja configurada en secrets: el snapshot no sirve
+        if snapshot.get("sheet_id") != sheet_id:
+            return None
+        return snapshot
+
+    def _write_snapshot(self, sheet_id, modified, data):
+        snapshot = {"sheet_id": sheet_id, "modified": modified, "saved_at": time.time(), "data": data}
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            tmp = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            # Sin disco se sigue sirviendo desde memoria
+            print(f"⚠️ No se pudo guardar el snapshot de {self.name}: {e}")
+
+    # ---------------------------- memoria -------------------------------
+
+    def get(self):
+        with self._lock:
+            value = self._value
+            if value is None:
+                snapshot = self._read_snapshot(self._sheet_id())
+                if snapshot is not None:
+                    # Viene del disco: se sirve ya y se revalida enseguida
+                    value = self._value = self._build(snapshot["data"])
+                    self._modified = snapshot.get("modified")
+                    self._checked = 0.0
+
+        if value is None:
+            return self.refresh()
+        if time.time() - self._checked > REVALIDATE_AFTER:
+            self._refresh_in_background()
+        return value
+
+    def reset(self):
+        # Olvida la copia en memoria (no la del disco), como tras un reinicio
+        with self._lock:
+            self._value, self._modified, self._checked = None, None, 0.0
+
+    def wait(self, timeout=None):
+        # Espera a que termine la revalidación en segundo plano, si hay una
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def save(self):
+        # Guarda la copia en memoria con los clientes agregados en sitio,
+        # para que un reinicio no los pierda. modified no cambia: la hoja sí
+        # cambió, así que la próxima revalidación la descarga igual.
+        with self._lock:
+            value, modified = self._value, self._modified
+            data = self._dump(value) if value is not None else None
+        if data is not None:
+            self._write_snapshot(self._sheet_id(), modified, data)
+
+    def invalidate(self):
+        # La hoja cambió por fuera: la próxima lectura revalida (sin
+        # bloquear, sigue sirviendo la copia actual mientras tanto)
+        with self._lock:
+            self._checked = 0.0
+            self._modified = None
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ No se pudo actualizar {self.name}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        self._thread = threading.Thread(target=run, name=f"snapshot-{self.name}", daemon=True)
+        self._thread.start()
+
+    def refresh(self):
+        # Revalida ya (bloqueante). Sin cambios en la hoja no la descarga.
+        with self._refresh_lock:
+            sheet_id = self._sheet_id()
+            try:
+                modified = self._modified_time(sheet_id)
+            except Exception as e:
+                print(f"⚠️ No se pudo leer modifiedTime de {self.name}: {e}")
+                modified = None
+
+            with self._lock:
+                if modified is not None and modified == self._modified and self._value is not None:
+                    self._checked = time.time()
+                    return self._value
+
+            try:
+                data = self._fetch(sheet_id)
+            except Exception as e:
+                print(f"⚠️ No se pudo leer {self.name}: {e}")
+                data = None
+            if data is None:
+                # Falló la lectura: se sigue con lo que había y se reintenta
+                # después de REVALIDATE_AFTER
+                with self._lock:
+                    self._checked = time.time()
+                    if self._value is None:
+                        self._value = self._build([])
+                    return self._value
+
+            value = self._build(data)
+            with self._lock:
+                self._value, self._modified, self._checked = value, modified, time.time()
+            self._write_snapshot(sheet_id, modified, data)
+            return value
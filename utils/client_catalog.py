@@ -0,0 +1,226 @@
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from types import MappingProxyType
+
+import pandas as pd
+from gspread.utils import numericise_all
+
+# ----------------------------------------------------------------------
+# Catálogo de clientes precalculado.
+#
+# Se construye una vez por versión de los datos (ver
+# utils.helpers.load_client_catalog_finance) y después los reruns de
+# Streamlit sólo lo referencian: la lista sin duplicados, el dict
+# nombre -> datos y un índice de prefijos normalizados ya están hechos.
+#
+# El índice es una lista ordenada de (clave, posición) con una entrada por
+# cada palabra del nombre, así "sol" encuentra "TRADING SOLUTIONS SAS".
+# Buscar un prefijo es una bisección más los k resultados.
+#
+# Es inmutable: para agregar clientes se construye uno nuevo (la lista
+# del anticipo, que crece en caliente, es ClientNames).
+# ----------------------------------------------------------------------
+
+SEARCH_LIMIT = 20
+
+
+def normalize_name(name) -> str:
+    # Sin tildes ni mayúsculas, "S.A.S" -> "sas" y el resto de signos
+    # como espacios simples
+    text = unicodedata.normalize("NFKD", str(name))
+    chars = []
+    for ch in text:
+        if unicodedata.combining(ch) or ch in ".'":
+            continue
+        chars.append(ch if ch.isalnum() else " ")
+    return " ".join("".join(chars).casefold().split())
+
+
+def _word_keys(name) -> list[str]:
+    # Una clave por palabra: el nombre normalizado desde esa palabra
+    words = normalize_name(name).split(" ")
+    return [" ".join(words[start:]) for start in range(len(words))]
+
+
+class ClientCatalog:
+    __slots__ = ("names", "lookup", "_members", "_index", "_options")
+
+    def __init__(self, names, lookup=None):
+        names = tuple(names)
+        self.names = names
+        self._members = frozenset(names)
+        self.lookup = MappingProxyType(dict(lookup or {}))
+
+        index = [(key, pos) for pos, name in enumerate(names) for key in _word_keys(name)]
+        index.sort()
+        self._index = index
+        self._options = {}
+
+    @classmethod
+    def from_names(cls, names):
+        seen = set()
+        unique = []
+        for name in names:
+            if name and name not in seen:
+                seen.add(name)
+                unique.append(name)
+        return cls(unique)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, name_column: str = "CLIENTE"):
+        # Un registro por cliente (el primero si hay repetidos)
+        if df.empty or name_column not in df.columns:
+            return cls(())
+        df = df.drop_duplicates(subset=name_column)
+        df = df[df[name_column].notna() & (df[name_column].astype(str).str.strip() != "")]
+        lookup = df.set_index(name_column).to_dict(orient="index")
+        return cls(df[name_column].tolist(), lookup)
+
+    def with_client(self, name, record=None) -> "ClientCatalog":
+        # Copia con un cliente más, sin reordenar el índice completo. Si
+        # ya existe se conserva el primer registro, como en from_frame.
+        if name is None or not str(name).strip() or name in self._members:
+            return self
+        other = ClientCatalog.__new__(ClientCatalog)
+        other.names = self.names + (name,)
+        other._members = self._members | {name}
+        lookup = dict(self.lookup)
+        if record is not None:
+            lookup[name] = dict(record)
+        other.lookup = MappingProxyType(lookup)
+        index = list(self._index)
+        for key in _word_keys(name):
+            insort(index, (key, len(self.names)))
+        other._index = index
+        other._options = {}
+        return other
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def get(self, name, default=None):
+        return self.lookup.get(name, default)
+
+    def options(self, *head) -> list:
+        # Opciones del selectbox (p. ej. " " y "+ Add New" antes de los
+        # nombres); la lista se arma una vez por cada `head`.
+        options = self._options.get(head)
+        if options is None:
+            options = self._options.setdefault(head, [*head, *self.names])
+        return options
+
+    def search(self, prefix: str, limit: int = SEARCH_LIMIT) -> list:
+        # Nombres con alguna palabra que empiece por `prefix`, en el
+        # orden del catálogo
+        key = normalize_name(prefix)
+        if not key:
+            return list(self.names[:limit])
+
+        found = set()
+        i = bisect_left(self._index, (key,))
+        while i < len(self._index):
+            entry, pos = self._index[i]
+            if not entry.startswith(key):
+                break
+            found.add(pos)
+            i += 1
+        return [self.names[pos] for pos in sorted(found)[:limit]]
+
+
+class ClientNames:
+    # Lista de clientes que sí crece en caliente (hoja "clientes" del
+    # anticipo). Guarda las claves normalizadas en un set para que revisar
+    # si un nombre ya existe sea O(1); add() actualiza la lista en su
+    # lugar, así el caché compartido no se descarta al agregar uno.
+
+    def __init__(self, names=()):
+        self.lock = threading.Lock()
+        self.names = []
+        self._keys = set()
+        self._options = {}
+        self.version = 0
+        self.rows = list(names)     # columna tal como está en la hoja, repetidos incluidos
+        for name in self.rows:
+            self._append(name)
+
+    def _append(self, name) -> bool:
+        key = normalize_name(name)
+        if not key or key in self._keys:
+            return False
+        self._keys.add(key)
+        self.names.append(name)
+        self.version += 1
+        return True
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return normalize_name(name) in self._keys
+
+    def add(self, name) -> bool:
+        # True si el nombre era nuevo
+        with self.lock:
+            return self._append(name)
+
+    def confirm_append(self, name, sheet_row) -> bool:
+        # Después de escribir `name`: `sheet_row` es la fila donde quedó.
+        # False si no es la siguiente a las que conocemos, es decir, alguien
+        # más escribió en la hoja y la lista hay que recargarla.
+        with self.lock:
+            if sheet_row == len(self.rows) + 1:
+                return True     # la lista se cargó después de escribir
+            if sheet_row != len(self.rows) + 2:
+                return False
+            # La lista pudo cambiarse por una descargada antes del append
+            # (revalidación en segundo plano): también va a los nombres
+            self.rows.append(name)
+            self._append(name)
+            return True
+
+    def options(self, *head) -> list:
+        version = self.version
+        cached = self._options.get(head)
+        if cached is None or cached[0] != version:
+            cached = self._options[head] = (version, [*head, *self.names])
+        return cached[1]
+
+
+class ClientDirectory:
+    # Hoja de clientes de finanzas en memoria (DataFrame + catálogo) con
+    # número de versión. append() aplica una fila recién escrita en la hoja
+    # sin volver a descargarla; la recarga completa queda para el TTL o
+    # cuando la fila escrita no es la que se esperaba (cambio externo).
+
+    def __init__(self, df: pd.DataFrame, name_column: str = "CLIENTE"):
+        self.lock = threading.Lock()
+        self.name_column = name_column
+        self.df = df
+        self.rows = len(df)
+        self.version = 0
+        self.catalog = ClientCatalog.from_frame(df, name_column)
+
+    def append(self, values: list, sheet_row) -> bool:
+        # `values` en el orden de las columnas de la hoja; False si hay que
+        # recargar.
+        with self.lock:
+            if sheet_row == self.rows + 1:
+                return True     # cargado después de escribir: ya la tiene
+            if sheet_row != self.rows + 2 or self.df.columns.empty:
+                return False
+
+            columns = list(self.df.columns)
+            values = numericise_all([str(v) for v in values[:len(columns)]])
+            record = dict(zip(columns, values + [""] * (len(columns) - len(values))))
+            self.df = pd.concat([self.df, pd.DataFrame([record])], ignore_index=True)
+            self.rows += 1
+            self.version += 1
+
+            name = record.get(self.name_column)
+            details = {k: v for k, v in record.items() if k != self.name_column}
+            self.catalog = self.catalog.with_client(name, details)
+            return True
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+# ----------------------------------------------------------------------
+# Caché columnar de hojas de Excel.
+#
+# Parsear un .xlsx con openpyxl es lentísimo comparado con leer columnas
+# ya tipadas. La primera lectura convierte la hoja a un archivo Arrow IPC
+# (Feather v2, sin comprimir) en CACHE_DIR: sin columnas vacías ni
+# "Unnamed: n" y con los textos repetidos como categorías. Las siguientes
+# lecturas abren ese archivo con memory_map, así los procesos del servidor
+# comparten las mismas páginas del sistema operativo.
+#
+# El .meta.json al lado guarda mtime, tamaño y sha256 del .xlsx: si sólo
+# cambió el mtime (copiado, touch) pero no el contenido, no se reconvierte.
+# ----------------------------------------------------------------------
+
+CACHE_DIR = "resources/cache/columnar"
+CATEGORY_MAX_RATIO = 0.5    # texto con menos de 50% de valores distintos -> categoría
+
+_lock = threading.Lock()
+_tables = {}    # ruta del caché -> (mtime, pa.Table)
+_sources = {}   # ruta del caché -> (mtime, tamaño) del .xlsx ya validado
+
+
+def _file_hash(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_paths(source, sheet_name, columns):
+    # Un archivo por (hoja, columnas pedidas)
+    name = os.path.splitext(os.path.basename(source))[0]
+    options = hashlib.sha1(json.dumps([os.path.abspath(source), sheet_name, columns]).encode()).hexdigest()[:10]
+    base = os.path.join(CACHE_DIR, f"{name}-{options}")
+    return f"{base}.arrow", f"{base}.meta.json"
+
+
+def _prune(df: pd.DataFrame, columns) -> pd.DataFrame:
+    if columns is not None:
+        keep = [c for c in columns if c in df.columns]
+    else:
+        keep = [c for c in df.columns if not str(c).startswith("Unnamed:") and not df[c].isna().all()]
+    df = df[keep].copy()
+
+    for column in df.columns:
+        series = df[column]
+        if series.dtype == object:
+            values = series.dropna()
+            # Sólo texto: las columnas mixtas (números y texto) quedan como
+            # texto para que Arrow pueda guardarlas
+            if not values.map(lambda v: isinstance(v, str)).all():
+                series = series.map(lambda v: v if pd.isna(v) else str(v))
+            if len(values) and values.nunique() <= CATEGORY_MAX_RATIO * len(values):
+                series = series.astype("category")
+            df[column] = series
+    return df
+
+
+def _convert(source, sheet_name, columns, cache_path):
+    df = pd.read_excel(source, sheet_name=sheet_name)
+    df = _prune(df, columns)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{cache_path}.{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, cache_path)
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    tmp = f"{meta_path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+def _open_table(cache_path) -> pa.Table:
+    mtime = os.stat(cache_path).st_mtime_ns
+    cached = _tables.get(cache_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    # Sin copiar: los buffers de la tabla apuntan al archivo mapeado
+    table = pa.ipc.open_file(pa.memory_map(cache_path, "r")).read_all()
+    _tables[cache_path] = (mtime, table)
+    return table
+
+
+def load_table(source, sheet_name=0, columns=None) -> pa.Table:
+    stat = os.stat(source)
+    cache_path, meta_path = _cache_paths(source, sheet_name, columns)
+
+    with _lock:
+        if _sources.get(cache_path) == (stat.st_mtime_ns, stat.st_size) and cache_path in _tables:
+            return _tables[cache_path][1]
+
+        meta = _read_meta(meta_path)
+        fresh = (
+            meta is not None
+            and os.path.exists(cache_path)
+            and meta.get("mtime_ns") == stat.st_mtime_ns
+            and meta.get("size") == stat.st_size
+        )
+        if not fresh:
+            digest = _file_hash(source)
+            if meta is None or meta.get("sha256") != digest or not os.path.exists(cache_path):
+                _convert(source, sheet_name, columns, cache_path)
+            _write_meta(meta_path, {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest})
+        _sources[cache_path] = (stat.st_mtime_ns, stat.st_size)
+        return _open_table(cache_path)
+
+
+def load_excel(source, sheet_name=0, columns=None) -> pd.DataFrame:
+    # Como pd.read_excel, pero desde el caché columnar
+    return load_table(source, sheet_name, columns).to_pandas(split_blocks=True)
@@ -1,6 +1,12 @@
 import streamlit as st
 import gspread
 import pandas as pd
+import threading
+import time
+from utils import sheets_backend
+from utils.catalog_snapshot import CatalogSnapshot
+from utils.columnar_cache import load_excel
+from utils.client_catalog import ClientCatalog, ClientDirectory, ClientNames
 
 @st.cache_resource(ttl=3600)
 def get_gspread_client() -> gspread.Client:
@@ -8,14 +14,92 @@ def get_gspread_client() -> gspread.Client:
     return gspread.service_account_from_dict(credentials)
 
 
+# ---------------- Caché de handles (Spreadsheet / Worksheet) ----------------
+# open_by_key y ss.worksheet() son llamadas de metadatos a la API. Los
+# handles se guardan por (sheet_id, pestaña) durante HANDLE_TTL segundos
+# para que un mismo envío no los vuelva a pedir en cada escritura.
+
+HANDLE_TTL = 600
+_handles = {}                      # (sheet_id, pestaña | None) -> (expira, handle)
+_handles_lock = threading.Lock()
+
+
+def _cached_handle(key):
+    with _handles_lock:
+        entry = _handles.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        _handles.pop(key, None)
+    return None
+
+
+def _store_handle(key, handle):
+    with _handles_lock:
+        _handles[key] = (time.monotonic() + HANDLE_TTL, handle)
+    return handle
+
+
+def evict_handle(sheet_id: str, sheet_name: str | None = None) -> None:
+    # Sin pestaña se descarta el spreadsheet y todas sus pestañas
+    with _handles_lock:
+        if sheet_name is not None:
+            _handles.pop((sheet_id, sheet_name), None)
+        else:
+            for key in [k for k in _handles if k[0] == sheet_id]:
+                del _handles[key]
+
+
+def get_sheets_backend():
+    backend = sheets_backend.get_backend()
+    if backend is None:
+        backend = sheets_backend.GspreadBackend(get_gspread_client)
+        sheets_backend.set_backend(backend)
+    return backend
+
+
+def use_sheets_backend(backend) -> None:
+    # Cambia el backend (p. ej. InMemoryBackend en benchmarks) y descarta
+    # los handles y las listas de clientes leídas con el anterior.
+    sheets_backend.set_backend(backend)
+    with _handles_lock:
+        _handles.clear()
+    clients_snapshot.reset()
+    clients_finance_snapshot.reset()
+
+
+def open_spreadsheet(sheet_id: str) -> gspread.Spreadsheet:
+    ss = _cached_handle((sheet_id, None))
+    if ss is None:
+        try:
+            ss = get_sheets_backend().open_by_key(sheet_id)
+        except gspread.exceptions.SpreadsheetNotFound:
+            evict_handle(sheet_id)
+            raise
+        _store_handle((sheet_id, None), ss)
+    return ss
+
+
+def open_worksheet(sheet_id: str, sheet_name: str) -> gspread.Worksheet:
+    ws = _cached_handle((sheet_id, sheet_name))
+    if ws is None:
+        try:
+            ws = open_spreadsheet(sheet_id).worksheet(sheet_name)
+        except gspread.exceptions.WorksheetNotFound:
+            evict_handle(sheet_id, sheet_name)
+            raise
+        _store_handle((sheet_id, sheet_name), ws)
+    return ws
+
+
+def cache_worksheet(sheet_id: str, ws: gspread.Worksheet) -> gspread.Worksheet:
+    return _store_handle((sheet_id, ws.title), ws)
+
+
 def get_worksheet(sheet_id: str, sheet_name: str) -> gspread.Worksheet | None:
-    gc = get_gspread_client()
     try:
-        ss = gc.open_by_key(sheet_id)
-        if sheet_name not in (ws.title for ws in ss.worksheets()):
-            st.error(f"❌ La pestaña '{sheet_name}' no existe en la hoja.")
-            return None
-        return ss.worksheet(sheet_name)
+        return open_worksheet(sheet_id, sheet_name)
+    except gspread.exceptions.WorksheetNotFound:
+        st.error(f"❌ La pestaña '{sheet_name}' no existe en la hoja.")
     except gspread.exceptions.SpreadsheetNotFound:
         st.error("❌ No se encontró la hoja de cálculo con el ID proporcionado.")
     except Exception as e:
@@ -23,29 +107,61 @@ def get_worksheet(sheet_id: str, sheet_name: str) -> gspread.Worksheet | None:
     return None
 
 
-@st.cache_data(ttl=3600)
-def load_clients() -> list[str]:
-    sheet_id   = st.secrets["general"]["time_sheet_id"]
-    sheet_name = "clientes"
+# ---------------- Listas de clientes ----------------
+# Se sirven desde memoria o desde el snapshot en disco y se revalidan en
+# segundo plano (ver utils/catalog_snapshot.py). register_new_client y
+# save_new_client_finance les agregan los clientes nuevos en su lugar.
 
-    ws = get_worksheet(sheet_id, sheet_name)
-    if ws is None:
-        return []
+# Estas funciones también corren en el hilo de revalidación, sin contexto
+# de Streamlit: nada de st.error, los errores suben a CatalogSnapshot.refresh
+# que los registra.
+
+def _sheet_modified_time(sheet_id: str) -> str:
+    return get_sheets_backend().file_modified_time(sheet_id)
 
-    clientes = ws.col_values(1)    # primera columna
+
+def _fetch_clients(sheet_id: str) -> list[str]:
+    clientes = open_worksheet(sheet_id, "clientes").col_values(1)    # primera columna
     return clientes[1:]            # omite encabezado
 
-@st.cache_data(ttl=3600)
+
+def _fetch_clients_finance(sheet_id: str) -> list[dict]:
+    return open_worksheet(sheet_id, "clientes").get_all_records()
+
+
+clients_snapshot = CatalogSnapshot(
+    "clientes",
+    lambda: st.secrets["general"]["time_sheet_id"],
+    _sheet_modified_time,
+    _fetch_clients,
+    ClientNames,
+    lambda clients: list(clients.rows),
+)
+
+clients_finance_snapshot = CatalogSnapshot(
+    "clientes_finanzas",
+    lambda: st.secrets["general"]["data_clientes"],
+    _sheet_modified_time,
+    _fetch_clients_finance,
+    lambda records: ClientDirectory(pd.DataFrame(records), "CLIENTE"),
+    lambda directory: directory.df.to_dict(orient="records"),
+)
+
+
+def load_clients() -> ClientNames:
+    return clients_snapshot.get()
+
+
 def load_clients_finance() -> pd.DataFrame:
-    sheet_id   = st.secrets["general"]["data_clientes"]
-    sheet_name = "clientes"
+    return load_client_directory_finance().df
 
-    ws = get_worksheet(sheet_id, sheet_name)
-    if ws is None:
-        return pd.DataFrame()
 
-    data = ws.get_all_records()
-    return pd.DataFrame(data)
+def load_client_directory_finance() -> ClientDirectory:
+    return clients_finance_snapshot.get()
+
+
+def load_client_catalog_finance() -> ClientCatalog:
+    return load_client_directory_finance().catalog
 
 
 def user_data(commercial):
@@ -147,6 +263,8 @@ def validate_request_data(data):
 
     return errors
 
+FINANCE_WORKBOOK = "resources/data/datos finanzas.xlsx"
+
 def load_client_finance():
-    data = pd.read_excel('resources/data/datos finanzas.xlsx')
-    return data
\ No newline at end of file
+    # Se convierte a Arrow una vez por versión del archivo (utils/columnar_cache.py)
+    return load_excel(FINANCE_WORKBOOK)
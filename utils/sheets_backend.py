@@ -0,0 +1,266 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import gspread
+from gspread.utils import a1_to_rowcol, numericise_all, rowcol_to_a1
+
+# ----------------------------------------------------------------------
+# Backends de almacenamiento para las hojas de cálculo.
+#
+# Todo el acceso a Sheets pasa por utils.helpers.open_spreadsheet, que le
+# pide el spreadsheet al backend activo. En producción es GspreadBackend
+# (Google Sheets real); InMemoryBackend imita el subconjunto de gspread
+# que usa la app, cuenta cada llamada a la "API" y puede simular
+# latencia, para medir o probar los flujos de envío sin cuenta de Google.
+# ----------------------------------------------------------------------
+
+
+class GspreadBackend:
+    def __init__(self, client_factory):
+        self._client_factory = client_factory
+
+    def open_by_key(self, key: str) -> gspread.Spreadsheet:
+        return self._client_factory().open_by_key(key)
+
+    def file_modified_time(self, key: str) -> str:
+        # Una sola llamada a Drive; open_by_key().get_lastUpdateTime() son
+        # dos (los metadatos de Sheets + Drive)
+        return self._client_factory().get_file_drive_metadata(key)["modifiedTime"]
+
+
+def cell_text(value) -> str:
+    # Texto con el que Sheets devuelve una celda escrita con `value`
+    # (get_all_values, formato automático): 25.0 -> "25", 0.1 + 0.2 -> "0.3".
+    # También lo usa services.sheet_index para que su copia en memoria sea
+    # igual a una lectura nueva de la hoja.
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        return f"{value:.15g}"
+    return str(value)
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet: "FakeSpreadsheet", sheet_id: int, title: str, rows: int = 1000, cols: int = 26):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self.col_count = int(cols)
+        self._min_rows = int(rows)
+        self._rows: list[list[str]] = []
+
+    def _call(self, name):
+        self.spreadsheet.backend._call(f"Worksheet.{name}")
+
+    @property
+    def row_count(self) -> int:
+        return max(self._min_rows, len(self._rows))
+
+    def _append(self, values_list) -> dict:
+        start = len(self._rows) + 1
+        for values in values_list:
+            self._rows.append([cell_text(v) for v in values])
+        self.spreadsheet._touch()
+        end = len(self._rows)
+        width = max((len(v) for v in values_list), default=1)
+        return {
+            "updates": {
+                "updatedRange": f"'{self.title}'!A{start}:{rowcol_to_a1(end, width)}",
+                "updatedRows": len(values_list),
+            }
+        }
+
+    def append_row(self, values, value_input_option="RAW", **kwargs) -> dict:
+        self._call("append_row")
+        return self._append([values])
+
+    def append_rows(self, values, value_input_option="RAW", **kwargs) -> dict:
+        self._call("append_rows")
+        return self._append(values)
+
+    def get_all_values(self, **kwargs) -> list[list[str]]:
+        self._call("get_all_values")
+        width = max((len(r) for r in self._rows), default=0)
+        return [row + [""] * (width - len(row)) for row in self._rows]
+
+    def get_all_records(self, head=1, default_blank="", **kwargs) -> list[dict]:
+        self._call("get_all_records")
+        if len(self._rows) < head:
+            return []
+        headers = self._rows[head - 1]
+        records = []
+        for row in self._rows[head:]:
+            row = row + [default_blank] * (len(headers) - len(row))
+            records.append(dict(zip(headers, numericise_all(row[:len(headers)]))))
+        return records
+
+    def col_values(self, col: int, **kwargs) -> list[str]:
+        self._call("col_values")
+        values = [row[col - 1] if len(row) >= col else "" for row in self._rows]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def get(self, range_name=None, **kwargs) -> list[list[str]]:
+        self._call("get")
+        first, _, last = (range_name or "A1").split("!")[-1].replace("'", "").partition(":")
+        start_row, start_col = a1_to_rowcol(first)
+        end_row, end_col = a1_to_rowcol(last) if last else (start_row, start_col)
+        values = []
+        for row in self._rows[start_row - 1:end_row]:
+            row = row[start_col - 1:end_col]
+            while row and row[-1] == "":
+                row.pop()
+            values.append(row)
+        # Como la API: sin filas vacías al final
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def delete_rows(self, start_index: int, end_index: int = None):
+        self._call("delete_rows")
+        self._delete(start_index, end_index or start_index)
+
+    def _delete(self, start_index: int, end_index: int):
+        del self._rows[start_index - 1:end_index]
+        self.spreadsheet._touch()
+
+    def update(self, values=None, range_name=None, **kwargs) -> dict:
+        self._call("update")
+        if isinstance(values, str) and not isinstance(range_name, str):
+            values, range_name = range_name, values     # firma antigua update(range, values)
+
+        first_cell = (range_name or "A1").split("!")[-1].split(":")[0].replace("'", "")
+        start_row, start_col = a1_to_rowcol(first_cell)
+        for offset, values_row in enumerate(values):
+            row_idx = start_row - 1 + offset
+            while len(self._rows) <= row_idx:
+                self._rows.append([])
+            row = self._rows[row_idx]
+            needed = start_col - 1 + len(values_row)
+            row.extend([""] * (needed - len(row)))
+            row[start_col - 1:needed] = [cell_text(v) for v in values_row]
+        self.spreadsheet._touch()
+        return {"updatedRange": range_name, "updatedRows": len(values)}
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend: "InMemoryBackend", key: str, title: str = None):
+        self.backend = backend
+        self.id = key
+        self.title = title or key
+        self._worksheets: list[FakeWorksheet] = []
+        self._next_sheet_id = 0
+        self._modified = datetime.now(timezone.utc)
+
+    def _touch(self):
+        self._modified = datetime.now(timezone.utc)
+
+    def _find(self, title) -> FakeWorksheet | None:
+        return next((ws for ws in self._worksheets if ws.title == title), None)
+
+    def create_worksheet(self, title: str, rows: int = 1000, cols: int = 26) -> FakeWorksheet:
+        # Para preparar datos de prueba sin contar llamadas
+        ws = FakeWorksheet(self, self._next_sheet_id, title, rows, cols)
+        self._next_sheet_id += 1
+        self._worksheets.append(ws)
+        return ws
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.backend._call("Spreadsheet.worksheet")
+        ws = self._find(title)
+        if ws is None:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return ws
+
+    def worksheets(self) -> list[FakeWorksheet]:
+        self.backend._call("Spreadsheet.worksheets")
+        return list(self._worksheets)
+
+    def add_worksheet(self, title: str, rows=1000, cols=26, **kwargs) -> FakeWorksheet:
+        self.backend._call("Spreadsheet.add_worksheet")
+        self._touch()
+        return self.create_worksheet(title, rows, cols)
+
+    def batch_update(self, body: dict) -> dict:
+        self.backend._call("Spreadsheet.batch_update")
+        for request in body.get("requests", []):
+            if "deleteDimension" not in request:
+                raise NotImplementedError(f"Request no soportado: {list(request)}")
+            rng = request["deleteDimension"]["range"]
+            if rng.get("dimension") != "ROWS":
+                raise NotImplementedError("Sólo se soporta borrar filas")
+            ws = next(ws for ws in self._worksheets if ws.id == rng["sheetId"])
+            ws._delete(rng["startIndex"] + 1, rng["endIndex"])
+        return {"spreadsheetId": self.id, "replies": [{} for _ in body.get("requests", [])]}
+
+    @property
+    def modified_time(self) -> str:
+        return self._modified.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+    def get_lastUpdateTime(self) -> str:
+        self.backend._call("Spreadsheet.get_lastUpdateTime")
+        return self.modified_time
+
+    @property
+    def lastUpdateTime(self) -> str:
+        return self.get_lastUpdateTime()
+
+
+class InMemoryBackend:
+    def __init__(self, latency: float = 0.0, auto_create: bool = True):
+        self.latency = latency
+        self.auto_create = auto_create
+        self.spreadsheets: dict[str, FakeSpreadsheet] = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def create_spreadsheet(self, key: str, title: str = None) -> FakeSpreadsheet:
+        ss = self.spreadsheets.get(key)
+        if ss is None:
+            ss = self.spreadsheets[key] = FakeSpreadsheet(self, key, title)
+        return ss
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self._call("open_by_key")
+        if key not in self.spreadsheets and not self.auto_create:
+            raise gspread.exceptions.SpreadsheetNotFound(key)
+        return self.create_spreadsheet(key)
+
+    def file_modified_time(self, key: str) -> str:
+        self._call("get_file_drive_metadata")
+        if key not in self.spreadsheets and not self.auto_create:
+            raise gspread.exceptions.SpreadsheetNotFound(key)
+        return self.create_spreadsheet(key).modified_time
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(backend) -> None:
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -2,77 +2,86 @@ import streamlit as st
 from forms.pre_orden_form import *
 import pytz
 from utils.helpers import *
+from utils.client_catalog import ClientCatalog
 from datetime import datetime
-from services.sheets_writer import save_order_submission, register_new_client
-from services.pdf_generator.generate_preorden import generate_archives
-from services.sheets_writer import save_surcharges_orden
+from services.sheets_writer import now_timestamp
+from services.pdf_generator import render_pool
+from services import write_queue
 
 def show():
 
+    write_queue.start_worker()
+    render_pool.start()
+
     colombia_timezone = pytz.timezone('America/Bogota')
 
     if "client_finance" not in st.session_state:
         st.session_state["client_finance"] = None
 
-    if "clients_list_finance" not in st.session_state:
-        try:
-            st.session_state["clients_list_finance"] = load_clients_finance()
-        except Exception as e:
-            st.error(f"Error al cargar la lista de clientes: {e}")
-            st.session_state["clients_list_finance"] = []
+    # Catálogo compartido entre sesiones; cada rerun sólo lo referencia
+    try:
+        client_catalog = load_client_catalog_finance()
+    except Exception as e:
+        st.error(f"Error al cargar la lista de clientes: {e}")
+        client_catalog = ClientCatalog(())
 
     if "start_time" not in st.session_state or st.session_state["start_time"] is None:
         st.session_state["start_time"] = datetime.now(colombia_timezone)
 
-    clients_list_finance = st.session_state["clients_list_finance"]
     start_time = st.session_state["start_time"]
 
-    order_info = forms(clients_list_finance)
+    order_info = forms(client_catalog)
 
     if st.button("Generar PDFs"):
-        save_order_submission(order_info)
-        register_new_client(order_info.get("client_finance"), st.session_state["clients_list_finance"])
-
-        try:
-            save_surcharges_orden(
-                order_info.get("no_solicitud", ""),
-                order_info.get("sales_surcharges", []),
-                order_info.get("cost_surcharges", [])
-            )
-            st.success("✅ Recargos guardados en Google Sheets.")
-        except Exception as e:
-            st.error(f"❌ Error al guardar recargos: {e}")
-
-        # Generar PDFs
-        pdf_ventas = generate_archives(order_info, "ventas")
-        pdf_costos = generate_archives(order_info, "costos")
-
-        st.session_state["pdf_paths"] = (pdf_ventas, pdf_costos)
-        st.success("✅ Archivos PDF creados exitosamente.")
-
-    if "pdf_paths" in st.session_state:
-        pdf_ventas, pdf_costos = st.session_state["pdf_paths"]
+        if not str(order_info.get("no_solicitud") or "").strip():
+            # Las filas de ORDEN, ventas y costos se ubican por este número
+            st.error("⚠️ Ingresa el Número del Caso (M) antes de generar los PDFs.")
+        else:
+            # Generar PDFs (en memoria, ventas y costos en paralelo en el pool)
+            try:
+                pdfs = render_pool.render_preorden(order_info, ("ventas", "costos"))
+            except render_pool.RenderError as e:
+                # Sin PDFs no se guarda nada: el reintento no deja la orden a medias
+                st.error(f"❌ No se pudieron generar los PDFs: {e}")
+            else:
+                st.session_state["pdf_files"] = (pdfs["ventas"], pdfs["costos"])
+                st.success("✅ Archivos PDF creados exitosamente.")
+
+                # Las escrituras a Google Sheets van a la cola en segundo plano
+                submitted_at = now_timestamp()
+                st.session_state["write_jobs"] = [
+                    write_queue.enqueue("save_order_submission", order_info=order_info, submitted_at=submitted_at),
+                    write_queue.enqueue(
+                        "save_surcharges_orden",
+                        no_solicitud=order_info.get("no_solicitud", ""),
+                        sales=order_info.get("sales_surcharges", []),
+                        costs=order_info.get("cost_surcharges", []),
+                    ),
+                ]
+
+    write_queue.render_status(st.session_state.get("write_jobs", []))
+
+    if "pdf_files" in st.session_state:
+        pdf_ventas, pdf_costos = st.session_state["pdf_files"]
 
         no_solicitud = order_info.get("no_solicitud", "")
 
         col1, col2 = st.columns(2)
 
         with col1:
-            with open(pdf_ventas, "rb") as f:
-                st.download_button(
-                    label="Descargar Orden de Venta",
-                    data=f,                       
-                    file_name=f"ORDEN {no_solicitud}.pdf",
-                    mime="application/pdf",
-                    key="dl_ventas"
-                )
+            st.download_button(
+                label="Descargar Orden de Venta",
+                data=pdf_ventas,
+                file_name=f"ORDEN {no_solicitud}.pdf",
+                mime="application/pdf",
+                key="dl_ventas"
+            )
 
         with col2:
-            with open(pdf_costos, "rb") as f:
-                st.download_button(
-                    label=f"Descargar Pre-orden Costo.pdf",
-                    data=f,
-                    file_name=f"COSTO {no_solicitud}.pdf",
-                    mime="application/pdf",
-                    key="dl_costos"
-                )
+            st.download_button(
+                label=f"Descargar Pre-orden Costo.pdf",
+                data=pdf_costos,
+                file_name=f"COSTO {no_solicitud}.pdf",
+                mime="application/pdf",
+                key="dl_costos"
+            )
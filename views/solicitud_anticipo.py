@@ -1,35 +1,40 @@
 import streamlit as st
 from utils.helpers import load_clients
+from utils.client_catalog import ClientNames
 from datetime import datetime
 import pytz
-from services.pdf_generator.generate_anticipo import generate_pdf
+from services.pdf_generator import render_pool
 from utils.helpers import *
-from services.sheets_writer import save_anticipo_submission, register_new_client
+from services.sheets_writer import register_new_client, now_timestamp
+from services import write_queue
 from forms.anticipo_form import forms
 
 colombia_timezone = pytz.timezone('America/Bogota')
 
 def show():
 
+    write_queue.start_worker()
+    render_pool.start()
+
     colombia_timezone = pytz.timezone('America/Bogota')
 
     if "client" not in st.session_state:
         st.session_state["client"] = None
 
-    if "clients_list" not in st.session_state:
-        try:
-            st.session_state["clients_list"] = load_clients()
-        except Exception as e:
-            st.error(f"Error al cargar la lista de clientes: {e}")
-            st.session_state["clients_list"] = []
+    # Lista compartida entre sesiones; los clientes nuevos se le agregan
+    # en su lugar (register_new_client)
+    try:
+        clients = load_clients()
+    except Exception as e:
+        st.error(f"Error al cargar la lista de clientes: {e}")
+        clients = ClientNames()
 
     if "start_time" not in st.session_state or st.session_state["start_time"] is None:
         st.session_state["start_time"] = datetime.now(colombia_timezone)
 
-    clients_list = st.session_state["clients_list"]
     start_time = st.session_state["start_time"]
 
-    request_data = forms(clients_list)
+    request_data = forms(clients)
 
     if st.button('Send Information'):
 
@@ -39,20 +44,30 @@ def show():
             for error in errors:
                 st.error(error)
         else:
-            save_anticipo_submission(request_data)
-
-            st.success("Information saved successfully!")
-
-            register_new_client(request_data.get("client"), st.session_state["clients_list"])
-
-            pdf_filename = generate_pdf(request_data)
-
-            with open(pdf_filename, "rb") as f:
-                pdf_bytes = f.read()
-
-            st.download_button(
-                label="Download PDF",
-                data=pdf_bytes,
-                file_name="Solicitud de Anticipo.pdf",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
\ No newline at end of file
+            try:
+                pdf_bytes = render_pool.render_anticipo(request_data)
+            except render_pool.RenderError as e:
+                # No se encola nada: reintentar no duplica la solicitud
+                st.error(f"❌ Could not generate the PDF: {e}")
+            else:
+                # El PDF queda en session_state: el botón de descarga sigue
+                # ahí en los reruns siguientes
+                st.session_state["anticipo_pdf"] = pdf_bytes
+
+                st.session_state["write_jobs"] = [
+                    write_queue.enqueue("save_anticipo_submission", data=request_data, submitted_at=now_timestamp())
+                ]
+                st.success("Information saved successfully!")
+
+                register_new_client(request_data.get("client"), clients)
+
+    write_queue.render_status(st.session_state.get("write_jobs", []))
+
+    if "anticipo_pdf" in st.session_state:
+        st.download_button(
+            label="Download PDF",
+            data=st.session_state["anticipo_pdf"],
+            file_name="Solicitud de Anticipo.pdf",
+            mime="application/pdf",
+            key="dl_anticipo"
+        )